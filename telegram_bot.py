@@ -3,31 +3,1655 @@
 """Telegram бот - ФІНАЛЬНА ВЕРСІЯ з автосповіщеннями"""
 
 import logging
+import logging.handlers
+import queue
+import atexit
+import contextvars
+import contextlib
+import copy
+import sys
+import argparse
 from datetime import datetime, timezone, timedelta
 import json
 import os
 import io
 import asyncio
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+import threading
+import hashlib
+import time
+import socket
+import re
+import sqlite3
+import mmap
+import fcntl
+import struct
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit, parse_qs, unquote
+import requests
+from bs4 import BeautifulSoup
+from telegram.error import RetryAfter
+from telegram import (
+    Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.ext import (
+    Application, ApplicationHandlerStop, BaseUpdateProcessor, CallbackQueryHandler,
+    CommandHandler, InlineQueryHandler, MessageHandler, TypeHandler, ContextTypes, filters
+)
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.patches import Rectangle
+from PIL import Image
 
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+# Логування: json (структуровано) або text; запис у stderr - в окремому потоці
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Часті рядки пишемо лише кожен N-й раз
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '20'))
+LOG_SAMPLED_PREFIXES = tuple(
+    p for p in os.getenv('LOG_SAMPLED_PREFIXES', '📖 ID групи,📥 /start,⏱️ Апдейт').split(',') if p
+)
+# Апдейти, повільніші за це, логуються завжди (поза семплінгом)
+LOG_SLOW_UPDATE_MS = float(os.getenv('LOG_SLOW_UPDATE_MS', '500'))
+
+# Контекст поточного апдейта: request_id, chat_id, час початку
+request_context = contextvars.ContextVar('request_context', default=None)
+
+
+class RequestContextFilter(logging.Filter):
+    """Копіює контекст апдейта в запис ще в потоці event loop (слухач його не бачить)"""
+    
+    def filter(self, record):
+        ctx = request_context.get()
+        if ctx is not None:
+            record.request_id = ctx['request_id']
+            record.chat_id = ctx['chat_id']
+            record.elapsed_ms = round((time.perf_counter() - ctx['started']) * 1000, 1)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає кожен N-й запис з частих префіксів; WARNING і вище - завжди"""
+    
+    def __init__(self, prefixes=LOG_SAMPLED_PREFIXES, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.prefixes = prefixes
+        self.every = max(1, every)
+        self.counters = {}
+    
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.every == 1 or getattr(record, 'force', False):
+            return True
+        msg = record.msg if isinstance(record.msg, str) else ''
+        for prefix in self.prefixes:
+            if msg.startswith(prefix):
+                count = self.counters.get(prefix, 0)
+                self.counters[prefix] = count + 1
+                if count % self.every:
+                    return False
+                record.sampled = self.every
+                return True
+        return True
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Як QueueHandler, але traceback лишається окремо в exc_text, а не вклеюється в msg"""
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+class JsonLogFormatter(logging.Formatter):
+    FIELDS = ('request_id', 'chat_id', 'elapsed_ms', 'handler_ms', 'wait_ms', 'sampled')
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging():
+    """Root -> QueueHandler (фільтри на потоці виклику) -> QueueListener -> stderr"""
+    if LOG_FORMAT == 'json':
+        formatter = JsonLogFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RequestContextFilter())
+    
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
 
 KYIV_TZ = timezone(timedelta(hours=2))
 
+# Скільки апдейтів обробляється паралельно (різні чати)
+MAX_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '16'))
+
+# HTTP API (JSON + iCalendar), вмикається якщо задано порт
+HTTP_API_HOST = os.getenv('HTTP_API_HOST', '127.0.0.1')
+HTTP_API_PORT = int(os.getenv('HTTP_API_PORT', '0'))
+# Скільки різних відповідей API тримати в кеші
+API_CACHE_SIZE = int(os.getenv('API_CACHE_SIZE', '256'))
+
+# Сховище стану: json (локальні файли) або sqlite (спільний том для кількох воркерів)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+STORAGE_PATH = os.getenv('STORAGE_PATH', 'bot_state.sqlite3')
+
+# Шардинг: апдейти розкладаються по воркерах за chat_id % WORKER_COUNT
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', '1'))
+WORKER_INDEX = int(os.getenv('WORKER_INDEX', '0'))
+LEADER_LEASE_SECONDS = int(os.getenv('LEADER_LEASE_SECONDS', '30'))
+# Оренда шарду: живий воркер підхоплює шард воркера, що не продовжив оренду
+SHARD_LEASE_SECONDS = int(os.getenv('SHARD_LEASE_SECONDS', '30'))
+INBOX_POLL_SECONDS = float(os.getenv('INBOX_POLL_SECONDS', '0.05'))
+# Скільки секунд ID групи зі спільного сховища вважається свіжим
+GROUP_CHAT_ID_TTL = float(os.getenv('GROUP_CHAT_ID_TTL', '30'))
+
+# Webhook (обов'язковий при WORKER_COUNT > 1, бо polling може тримати лише один процес)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
+
+# За скільки хвилин попереджати групу про зміну статусу (0 - вимкнено)
+ALERT_LEAD_MINUTES = int(os.getenv('ALERT_LEAD_MINUTES', '0'))
+
+# Джерела графіків (адаптери регіонів), JSON-список у SOURCE_ADAPTERS, напр.:
+# [{"type": "table", "region": "mk", "url": "https://off.energy.mk.ua/"}]
+SOURCE_ADAPTERS = os.getenv('SOURCE_ADAPTERS', '')
+SOURCE_POLL_SECONDS = int(os.getenv('SOURCE_POLL_SECONDS', '300'))
+SOURCE_CONCURRENCY = int(os.getenv('SOURCE_CONCURRENCY', '4'))
+SOURCE_TIMEOUT = float(os.getenv('SOURCE_TIMEOUT', '20'))
+# Яка група з джерел підміняє ручний графік бота ("регіон:група")
+SOURCE_PRIMARY = os.getenv('SOURCE_PRIMARY', 'mk:3.1')
+
+# Вихідні запити до Telegram: смуги пріоритету (менше число - вищий пріоритет)
+LANE_INTERACTIVE = 0  # відповіді користувачам
+LANE_LIVE = 1         # редагування вже надісланих повідомлень
+LANE_BROADCAST = 2    # розсилки в групу
+LANE_NAMES = {LANE_INTERACTIVE: 'interactive', LANE_LIVE: 'live', LANE_BROADCAST: 'broadcast'}
+
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '8'))
+OUTBOUND_QUEUE_SIZE = int(os.getenv('OUTBOUND_QUEUE_SIZE', '200'))
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))  # повідомлень/сек на бота
+CONNECTION_POOL_SIZE = int(os.getenv('CONNECTION_POOL_SIZE', '32'))
+
+# Статистика: скільки картинок можна малювати одночасно і як часто одному користувачу
+RENDER_BUDGET = int(os.getenv('RENDER_BUDGET', '2'))
+STATS_COOLDOWN_SECONDS = int(os.getenv('STATS_COOLDOWN_SECONDS', '60'))
+
+# Inline-режим: @bot now / @bot tomorrow / @bot 3.1
+INLINE_ALIASES = {
+    '': 'all', '3.1': 'all',
+    'now': 'now', 'зараз': 'now',
+    'today': 'today', 'сьогодні': 'today', 'schedule': 'today', 'графік': 'today',
+    'tomorrow': 'tomorrow', 'завтра': 'tomorrow',
+}
+
+# Вихідний формат картинок: png (палітра), webp або jpeg
+STATS_IMAGE_FORMAT = os.getenv('STATS_IMAGE_FORMAT', 'png').lower()
+STATS_IMAGE_COLORS = int(os.getenv('STATS_IMAGE_COLORS', '16'))    # розмір палітри для png
+STATS_IMAGE_QUALITY = int(os.getenv('STATS_IMAGE_QUALITY', '80'))  # webp/jpeg; webp 100 = без втрат
+STATS_IMAGE_DPI = int(os.getenv('STATS_IMAGE_DPI', '150'))
+
+# Архів півгодинних статусів по днях (не чиститься) - для /heatmap
+STATUS_ARCHIVE = "status_archive"
+# Скільки днів тримати в архіві (52 тижні) - розмір запису в json-бекенді обмежений
+ARCHIVE_DAYS = int(os.getenv('ARCHIVE_DAYS', '364'))
+WEEKDAY_SHORT = ['ПН', 'ВТ', 'СР', 'ЧТ', 'ПТ', 'СБ', 'НД']
+
+# Налаштування користувачів: скільки тримати в пам'яті
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_SETTINGS = "user_settings"
+DEFAULT_USER_SETTINGS = {'group': '3.1', 'reminder_minutes': 0}
+
+# /window: скільки вікон показувати
+WINDOW_RESULTS = 5
+
+# Бінарний знімок графіків+статистики для інших процесів (mmap), вмикається шляхом
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', '')
+
+# Ліміт Telegram на довжину повідомлення
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Скільки днів максимум на одній сторінці /schedule <з>..<по>
+RANGE_PAGE_DAYS = 7
+
+DAY_NAMES = {
+    'Mon': 'Понеділок', 'Tue': 'Вівторок', 'Wed': 'Середа',
+    'Thu': 'Четвер', 'Fri': "П'ятниця", 'Sat': 'Субота', 'Sun': 'Неділя'
+}
+
+
+def telegram_len(text):
+    """Довжина так, як її рахує Telegram (UTF-16), емодзі - по 2"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_message(blocks, header="", footer="", limit=TELEGRAM_MESSAGE_LIMIT, max_blocks=None):
+    """Пакує блоки в повідомлення, кожне не довше за limit"""
+    pages = []
+    current = header
+    current_len = telegram_len(header)
+    footer_len = telegram_len(footer)
+    count = 0
+    
+    for block in blocks:
+        block_len = telegram_len(block)
+        too_long = current_len + block_len + footer_len > limit
+        too_many = max_blocks is not None and count >= max_blocks
+        if count > 0 and (too_long or too_many):
+            pages.append(current)
+            current = ""
+            current_len = 0
+            count = 0
+        current += block
+        current_len += block_len
+        count += 1
+    
+    pages.append(current + footer)
+    return pages
+
+
+class ScheduleIndex:
+    """Індекс графіків по датах: відсортовані дати + скомпільовані періоди.
+    
+    rebuild(), update_day() і remove_day() збирають нові структури (копії) і
+    підміняють їх одним присвоєнням, тому читачам (зокрема рендеру в потоці)
+    не потрібен лок - вони бачать або старий, або новий знімок.
+    """
+    
+    def __init__(self):
+        self.version = 0
+        self.built_at = datetime.now(timezone.utc)
+        self.dates = []
+        self.days = {}
+        self.digests = {}
+    
+    @staticmethod
+    def digest(schedule):
+        raw = json.dumps([list(p) for p in schedule], separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+    
+    @staticmethod
+    def compile_day(schedule):
+        """[(h, m, status), ...] -> [(start_min, end_min, status), ...]"""
+        periods = []
+        for i, (h, m, status) in enumerate(schedule):
+            if i + 1 < len(schedule):
+                next_h, next_m, _ = schedule[i + 1]
+                end_min = next_h * 60 + next_m
+            else:
+                end_min = 24 * 60
+            periods.append((h * 60 + m, end_min, status))
+        return periods
+    
+    @classmethod
+    def digest_all(cls, schedules):
+        raw = json.dumps({d: cls.digest(schedules[d]) for d in sorted(schedules)}, separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+    
+    def rebuild(self, schedules):
+        """Повертає (змінені дати, видалені дати)"""
+        dates = sorted(schedules)
+        days = {}
+        digests = {}
+        changed = []
+        
+        for date_str in dates:
+            digest = self.digest(schedules[date_str])
+            digests[date_str] = digest
+            if self.digests.get(date_str) == digest:
+                days[date_str] = self.days[date_str]
+            else:
+                days[date_str] = self.compile_day(schedules[date_str])
+                changed.append(date_str)
+        
+        removed = [d for d in self.dates if d not in digests]
+        
+        self.dates, self.days, self.digests = dates, days, digests
+        if changed or removed:
+            self.version += 1
+            self.built_at = datetime.now(timezone.utc)
+        
+        return changed, removed
+    
+    def update_day(self, date_str, schedule):
+        """Точкове оновлення одного дня (без перебору інших); True якщо змінився"""
+        digest = self.digest(schedule)
+        if self.digests.get(date_str) == digest:
+            return False
+        
+        dates = self.dates
+        if date_str not in self.digests:
+            dates = list(dates)
+            dates.insert(bisect_left(dates, date_str), date_str)
+        days = dict(self.days)
+        days[date_str] = self.compile_day(schedule)
+        digests = dict(self.digests)
+        digests[date_str] = digest
+        
+        self.dates, self.days, self.digests = dates, days, digests
+        self.version += 1
+        self.built_at = datetime.now(timezone.utc)
+        return True
+    
+    def remove_day(self, date_str):
+        if date_str not in self.digests:
+            return False
+        
+        dates = list(self.dates)
+        dates.pop(bisect_left(dates, date_str))
+        days = dict(self.days)
+        del days[date_str]
+        digests = dict(self.digests)
+        del digests[date_str]
+        
+        self.dates, self.days, self.digests = dates, days, digests
+        self.version += 1
+        self.built_at = datetime.now(timezone.utc)
+        return True
+    
+    def range(self, from_str, to_str):
+        """Дати з графіком у проміжку [from_str, to_str]"""
+        dates = self.dates
+        return dates[bisect_left(dates, from_str):bisect_right(dates, to_str)]
+    
+    def periods(self, date_str):
+        return self.days.get(date_str)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Паралельна обробка апдейтів: різні чати - одночасно, один чат - по черзі.
+    
+    Базовий process_update бере глобальний семафор ще до do_process_update, тож
+    апдейт, що чекає на свій чат, тримав би слот. Тому семафор базового класу
+    підміняємо пустим, а свій слот беремо вже після черги чату.
+    
+    Це залежить від приватного _semaphore у python-telegram-bot==20.7 (пін у
+    requirements.txt); при оновленні PTB перевірити - тут стоїть assert.
+    """
+    
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        assert hasattr(self, '_semaphore'), "BaseUpdateProcessor без _semaphore - перевірте версію PTB"
+        self._semaphore = contextlib.nullcontext()
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_waiters = {}
+    
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        return None
+    
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        chat = getattr(update, 'effective_chat', None)
+        ctx = {
+            'request_id': f"u{getattr(update, 'update_id', id(update))}",
+            'chat_id': chat.id if chat is not None else None,
+            'started': time.perf_counter()
+        }
+        token = request_context.set(ctx)
+        wait_ms = 0.0
+        
+        try:
+            if key is None:
+                async with self._slots:
+                    await coroutine
+                return
+            
+            lock = self._chat_locks.get(key)
+            if lock is None:
+                lock = self._chat_locks[key] = asyncio.Lock()
+            self._chat_waiters[key] = self._chat_waiters.get(key, 0) + 1
+            
+            try:
+                async with lock, self._slots:
+                    wait_ms = (time.perf_counter() - ctx['started']) * 1000
+                    await coroutine
+            finally:
+                self._chat_waiters[key] -= 1
+                if self._chat_waiters[key] == 0:
+                    del self._chat_waiters[key]
+                    del self._chat_locks[key]
+        finally:
+            total_ms = (time.perf_counter() - ctx['started']) * 1000
+            logger.info(
+                f"⏱️ Апдейт {ctx['request_id']}: {total_ms:.1f} мс",
+                extra={
+                    'handler_ms': round(total_ms - wait_ms, 1),
+                    'wait_ms': round(wait_ms, 1),
+                    'force': total_ms >= LOG_SLOW_UPDATE_MS
+                }
+            )
+            request_context.reset(token)
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        self._chat_locks.clear()
+        self._chat_waiters.clear()
+
+
+class TokenBucket:
+    """Відро токенів з резервуванням: reserve() повертає скільки треба почекати"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self):
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+    
+    def delay(self):
+        """Скільки чекати до наступного токена, не забираючи його"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class OutboundDispatcher:
+    """Єдина черга вихідних запитів до Telegram.
+    
+    - смуги пріоритету: interactive -> live -> broadcast
+    - глобальний ліміт і ліміт на чат (приват ~1/с, група ~20/хв)
+    - обмежені черги: продюсер чекає в send(), якщо смуга переповнена
+    - у кожного чату своя FIFO-черга; воркер отримує чат лише коли в нього
+      є токен, тож загальмований чат не займає воркерів
+    """
+    
+    def __init__(self, workers=OUTBOUND_WORKERS, queue_size=OUTBOUND_QUEUE_SIZE, global_rate=OUTBOUND_GLOBAL_RATE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = None
+        self._queued = {lane: 0 for lane in LANE_NAMES}
+        self._ready_chats = {lane: deque() for lane in LANE_NAMES}
+        self._chat_queues = {}
+        self._ready = None
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._paused_until = 0
+        self._tasks = []
+        self.stats = {
+            lane: {'sent': 0, 'failed': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+            for lane in LANE_NAMES
+        }
+    
+    async def start(self):
+        self._ready = asyncio.Semaphore(0)
+        self._slots = {lane: asyncio.Semaphore(self.queue_size) for lane in LANE_NAMES}
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+    
+    async def send(self, lane, chat_id, func, *args, **kwargs):
+        """Ставить виклик у чергу чату і чекає на результат"""
+        if not self._tasks:
+            return await func(*args, **kwargs)
+        
+        await self._slots[lane].acquire()
+        self._queued[lane] += 1
+        future = asyncio.get_running_loop().create_future()
+        
+        chat_queue = self._chat_queues.get(chat_id)
+        if chat_queue is None:
+            # Чат був неактивний - ставимо його в розклад
+            self._chat_queues[chat_id] = deque([(lane, time.monotonic(), func, args, kwargs, future)])
+            self._schedule_chat(chat_id)
+        else:
+            chat_queue.append((lane, time.monotonic(), func, args, kwargs, future))
+        return await future
+    
+    def _schedule_chat(self, chat_id):
+        """Чат з непорожньою чергою: у ready-смугу, коли буде токен; до того - таймер"""
+        delay = self._chat_bucket(chat_id).delay()
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self._schedule_chat, chat_id)
+            return
+        lane = self._chat_queues[chat_id][0][0]
+        self._ready_chats[lane].append(chat_id)
+        self._ready.release()
+    
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                idle = time.monotonic() - 60
+                self._chat_buckets = {
+                    k: b for k, b in self._chat_buckets.items()
+                    if b.updated > idle or k in self._chat_queues
+                }
+            # Групи: 20 повідомлень/хв, приватні чати: ~1/с з невеликим запасом
+            bucket = TokenBucket(20 / 60, 3) if chat_id < 0 else TokenBucket(1, 3)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+    
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            for lane, ready in self._ready_chats.items():
+                if ready:
+                    chat_id = ready.popleft()
+                    break
+            else:
+                continue
+            
+            chat_queue = self._chat_queues[chat_id]
+            _, enqueued_at, func, args, kwargs, future = chat_queue.popleft()
+            self._queued[lane] -= 1
+            self._slots[lane].release()
+            
+            try:
+                self._chat_bucket(chat_id).reserve()
+                await self._deliver(lane, enqueued_at, chat_id, func, args, kwargs, future)
+            finally:
+                # Чат у розкладі лише один раз - порядок повідомлень зберігається
+                if chat_queue:
+                    self._schedule_chat(chat_id)
+                else:
+                    del self._chat_queues[chat_id]
+    
+    async def _deliver(self, lane, enqueued_at, chat_id, func, args, kwargs, future):
+        delay = self._global.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        
+        stats = self.stats[lane]
+        wait = time.monotonic() - enqueued_at
+        stats['wait_total'] += wait
+        stats['wait_max'] = max(stats['wait_max'], wait)
+        
+        for attempt in range(3):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            
+            try:
+                result = await func(*args, **kwargs)
+            except RetryAfter as e:
+                logger.warning(f"⏳ Flood control: {e.retry_after}с ({LANE_NAMES[lane]})")
+                self._paused_until = time.monotonic() + float(e.retry_after)
+                continue
+            except Exception as e:
+                stats['failed'] += 1
+                if not future.done():
+                    future.set_exception(e)
+                return
+            
+            stats['sent'] += 1
+            if not future.done():
+                future.set_result(result)
+            return
+        
+        stats['failed'] += 1
+        if not future.done():
+            future.set_exception(RuntimeError("Telegram flood control: спроби вичерпано"))
+    
+    def snapshot(self):
+        result = {}
+        for lane, name in LANE_NAMES.items():
+            stats = self.stats[lane]
+            done = stats['sent'] + stats['failed']
+            result[name] = {
+                'queued': self._queued[lane],
+                'sent': stats['sent'],
+                'failed': stats['failed'],
+                'wait_avg_ms': round(stats['wait_total'] / done * 1000, 1) if done else 0.0,
+                'wait_max_ms': round(stats['wait_max'] * 1000, 1),
+            }
+        return result
+
+
+class IntervalIndex:
+    """Суцільні інтервали світла/відключень через усі дні графіка.
+    
+    Час - абсолютні хвилини (ordinal дати * 1440 + хвилина дня). Сусідні однакові
+    періоди (в т.ч. через північ) зливаються. Для кожного статусу - відсортовані
+    початки/кінці і дерево максимумів довжин, тож "наступні N інтервалів довжиною
+    >= d" шукаються за O(log n) на результат, без перебору періодів.
+    """
+    
+    def __init__(self, schedule_index):
+        self.version = schedule_index.version
+        intervals = []
+        
+        for date_str in schedule_index.dates:
+            day = datetime.strptime(date_str, '%Y-%m-%d').toordinal() * 1440
+            for start_min, end_min, status in schedule_index.periods(date_str):
+                start, end = day + start_min, day + end_min
+                if intervals and intervals[-1][1] == start and intervals[-1][2] == status:
+                    intervals[-1][1] = end
+                elif end > start:
+                    intervals.append([start, end, status])
+        
+        self.by_status = {}
+        for status in (True, False):
+            items = [(start, end) for start, end, st in intervals if st == status]
+            starts = [start for start, _ in items]
+            ends = [end for _, end in items]
+            self.by_status[status] = (starts, ends, self._build_tree([e - s for s, e in items]))
+    
+    @staticmethod
+    def _build_tree(lengths):
+        size = 1
+        while size < max(1, len(lengths)):
+            size *= 2
+        tree = [0] * (2 * size)
+        tree[size:size + len(lengths)] = lengths
+        for i in range(size - 1, 0, -1):
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+        return tree
+    
+    @staticmethod
+    def _first_at_least(tree, lo, duration):
+        """Перший індекс >= lo з довжиною >= duration або None"""
+        size = len(tree) // 2
+        
+        def descend(node, node_lo, node_hi):
+            if node_hi <= lo or tree[node] < duration:
+                return None
+            if node >= size:
+                return node - size
+            mid = (node_lo + node_hi) // 2
+            found = descend(2 * node, node_lo, mid)
+            if found is None:
+                found = descend(2 * node + 1, mid, node_hi)
+            return found
+        
+        return descend(1, 0, size)
+    
+    def find(self, status, duration, after, limit=WINDOW_RESULTS):
+        """Наступні інтервали статусу, в яких після after лишається >= duration хвилин"""
+        starts, ends, tree = self.by_status[status]
+        results = []
+        
+        i = bisect_right(ends, after)
+        if i < len(starts) and starts[i] <= after:
+            # Інтервал уже триває - рахуємо лише залишок
+            if ends[i] - after >= duration:
+                results.append((after, ends[i]))
+            i += 1
+        
+        while len(results) < limit:
+            j = self._first_at_least(tree, i, duration)
+            if j is None or j >= len(starts):
+                break
+            results.append((starts[j], ends[j]))
+            i = j + 1
+        
+        return results
+    
+    def longest(self, status, window_start, window_end):
+        """Найдовший інтервал статусу в межах [window_start, window_end) (обрізаний)"""
+        starts, ends, _ = self.by_status[status]
+        best = None
+        
+        i = bisect_right(ends, window_start)
+        while i < len(starts) and starts[i] < window_end:
+            start, end = max(starts[i], window_start), min(ends[i], window_end)
+            if best is None or end - start > best[1] - best[0]:
+                best = (start, end)
+            i += 1
+        
+        return best
+
+
+class ScheduleSnapshot:
+    """Формат бінарного знімка (little-endian, лише читання після публікації):
+    
+    заголовок  HEADER:  magic, generation, кількість днів, кількість періодів
+    дні        DAY_DTYPE:    ordinal дати, зсув і кількість періодів, прапорці, години зі/без світла
+    періоди    PERIOD_DTYPE: початок/кінець (хвилини дня), статус
+    
+    Поруч лежить <path>.gen - 8 байт з номером останньої опублікованої генерації.
+    """
+    
+    MAGIC = b'PWRSNAP1'
+    HEADER = struct.Struct('<8sQII')
+    DAY_DTYPE = np.dtype([
+        ('ordinal', '<i4'), ('offset', '<u4'), ('count', '<u2'), ('flags', '<u2'),
+        ('hours_with', '<f4'), ('hours_without', '<f4')
+    ])
+    PERIOD_DTYPE = np.dtype([('start', '<u2'), ('end', '<u2'), ('status', 'u1'), ('pad', 'u1')])
+    HAS_STATS = 1
+
+
+class SnapshotPublisher(ScheduleSnapshot):
+    """Пише новий знімок у тимчасовий файл і атомарно підміняє його (os.replace),
+    після чого збільшує лічильник генерації - читачі ніколи не бачать напівзапис.
+    
+    Кілька воркерів можуть публікувати в один шлях: публікація йде під flock на
+    .gen файлі, а номер генерації читається зі спільного лічильника, не з кешу.
+    """
+    
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.gen_path = f"{path}.gen"
+        if not os.path.exists(self.gen_path):
+            with open(self.gen_path, 'wb') as f:
+                f.write(struct.pack('<Q', 0))
+        self._gen_file = open(self.gen_path, 'r+b')
+        self._gen_map = mmap.mmap(self._gen_file.fileno(), 8)
+        self.generation = struct.unpack_from('<Q', self._gen_map)[0]
+    
+    def build(self, schedule_index, stats, generation):
+        dates = schedule_index.dates
+        days = np.zeros(len(dates), dtype=self.DAY_DTYPE)
+        all_periods = []
+        
+        for i, date_str in enumerate(dates):
+            periods = schedule_index.periods(date_str)
+            day = days[i]
+            day['ordinal'] = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+            day['offset'] = len(all_periods)
+            day['count'] = len(periods)
+            record = stats.get(date_str)
+            if record:
+                day['flags'] = self.HAS_STATS
+                day['hours_with'] = record['hours_with_power']
+                day['hours_without'] = record['hours_without_power']
+            all_periods.extend((start, end, 1 if status else 0, 0) for start, end, status in periods)
+        
+        periods = np.array(all_periods, dtype=self.PERIOD_DTYPE)
+        header = self.HEADER.pack(self.MAGIC, generation, len(days), len(periods))
+        return header + days.tobytes() + periods.tobytes()
+    
+    def publish(self, schedule_index, stats):
+        fcntl.flock(self._gen_file, fcntl.LOCK_EX)
+        try:
+            generation = struct.unpack_from('<Q', self._gen_map)[0] + 1
+            blob = self.build(schedule_index, stats, generation)
+            
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, self.path)
+            
+            struct.pack_into('<Q', self._gen_map, 0, generation)
+            self._gen_map.flush()
+        finally:
+            fcntl.flock(self._gen_file, fcntl.LOCK_UN)
+        
+        self.generation = generation
+        return generation
+
+
+class SnapshotReader(ScheduleSnapshot):
+    """Для воркер-процесів: мапить знімок без копіювання (numpy views поверх mmap)
+    і підхоплює нову генерацію при наступному refresh()."""
+    
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.gen_path = f"{path}.gen"
+        self.generation = None
+        self.days = None
+        self.periods = None
+        self._map = None
+        self._gen_map = None
+    
+    def current_generation(self):
+        if self._gen_map is None:
+            with open(self.gen_path, 'rb') as f:
+                self._gen_map = mmap.mmap(f.fileno(), 8, access=mmap.ACCESS_READ)
+        return struct.unpack_from('<Q', self._gen_map)[0]
+    
+    def refresh(self):
+        """Перемаплює файл, якщо вийшла нова генерація; True якщо дані змінились"""
+        if self.current_generation() == self.generation:
+            return False
+        
+        with open(self.path, 'rb') as f:
+            new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, generation, n_days, n_periods = self.HEADER.unpack_from(new_map)
+        if magic != self.MAGIC:
+            raise ValueError(f"Невідомий формат знімка: {magic!r}")
+        
+        offset = self.HEADER.size
+        days = np.frombuffer(new_map, dtype=self.DAY_DTYPE, count=n_days, offset=offset)
+        offset += n_days * self.DAY_DTYPE.itemsize
+        periods = np.frombuffer(new_map, dtype=self.PERIOD_DTYPE, count=n_periods, offset=offset)
+        
+        # Старий mmap звільниться, коли на нього не лишиться посилань
+        self._map, self.days, self.periods, self.generation = new_map, days, periods, generation
+        return True
+    
+    def _day(self, date_str):
+        ordinal = datetime.strptime(date_str, '%Y-%m-%d').toordinal()
+        i = int(np.searchsorted(self.days['ordinal'], ordinal))
+        if i < len(self.days) and self.days['ordinal'][i] == ordinal:
+            return self.days[i]
+        return None
+    
+    def get_periods(self, date_str):
+        """[(start_min, end_min, status), ...] як у ScheduleIndex.periods"""
+        day = self._day(date_str)
+        if day is None:
+            return None
+        chunk = self.periods[day['offset']:day['offset'] + day['count']]
+        return [(int(p['start']), int(p['end']), bool(p['status'])) for p in chunk]
+    
+    def get_stats(self, date_str):
+        day = self._day(date_str)
+        if day is None or not day['flags'] & self.HAS_STATS:
+            return None
+        return {
+            'hours_with_power': round(float(day['hours_with']), 1),
+            'hours_without_power': round(float(day['hours_without']), 1)
+        }
+
+
+class JsonFileStorage:
+    """Локальне сховище: кожен ключ - окремий JSON файл, як і раніше.
+    
+    Підходить лише для одного процесу: лідерство завжди наше, черги між воркерами немає.
+    Відоме обмеження: save_records() перечитує і переписує весь файл набору записів,
+    тож зміна одного дня статистики коштує O(збережених днів). Якщо це важливо -
+    STORAGE_BACKEND=sqlite, де пишуться лише змінені рядки.
+    """
+    
+    shared = False
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+    
+    def load(self, name, default):
+        with self._lock:
+            try:
+                with open(name, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except:
+                return default
+    
+    def save(self, name, data):
+        """Атомарний запис: читач ніколи не побачить напівзаписаний файл"""
+        with self._lock:
+            tmp_path = f"{name}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, name)
+    
+    def load_records(self, name):
+        return self.load(name, {})
+    
+    def load_record(self, name, key):
+        return self.load(name, {}).get(key)
+    
+    def save_records(self, name, changed, removed=()):
+        """Оновлює/видаляє окремі записи; файл переписується лише якщо є зміни"""
+        if not changed and not removed:
+            return
+        with self._lock:
+            records = self.load(name, {})
+            records.update(changed)
+            for key in removed:
+                records.pop(key, None)
+            self.save(name, records)
+    
+    def delete_records_before(self, name, cutoff):
+        """Видаляє записи з ключем < cutoff (ключі - дати YYYY-MM-DD)"""
+        with self._lock:
+            records = self.load(name, {})
+            expired = [key for key in records if key < cutoff]
+            if expired:
+                self.save_records(name, {}, expired)
+    
+    def try_acquire_lease(self, name, holder, ttl):
+        return True
+    
+    def release_lease(self, name, holder):
+        pass
+    
+    def lease_alive(self, name):
+        return False
+    
+    def enqueue_update(self, shard, payload):
+        raise RuntimeError("JsonFileStorage не підтримує кілька воркерів")
+    
+    def claim_updates(self, shard, limit=100):
+        return []
+
+
+class MemoryStorage(JsonFileStorage):
+    """Сховище в пам'яті (симулятор, локальні перевірки) - нічого не пише на диск"""
+    
+    def __init__(self):
+        super().__init__()
+        self._data = {}
+    
+    def load(self, name, default):
+        with self._lock:
+            if name not in self._data:
+                return default
+            return json.loads(self._data[name])
+    
+    def save(self, name, data):
+        with self._lock:
+            self._data[name] = json.dumps(data, ensure_ascii=False)
+
+
+class SqliteStorage:
+    """Спільне сховище для кількох воркерів (SQLite файл на спільному томі).
+    
+    kv      - той самий стан, що й JSON файли (ключ = ім'я файлу)
+    leases  - оренди з терміном дії (лідер, воркери, шарди)
+    inbox   - апдейти, переслані у чужий шард
+    """
+    
+    shared = True
+    
+    def __init__(self, path=STORAGE_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=10000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS inbox (id INTEGER PRIMARY KEY AUTOINCREMENT, shard INTEGER NOT NULL, payload TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS inbox_shard ON inbox (shard, id);
+            CREATE TABLE IF NOT EXISTS records (name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (name, key));
+        """)
+    
+    def load(self, name, default):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+    
+    def save(self, name, data):
+        value = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO kv (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                (name, value)
+            )
+    
+    def load_records(self, name):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM records WHERE name = ?", (name,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+    
+    def load_record(self, name, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM records WHERE name = ? AND key = ?", (name, key)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_records(self, name, changed, removed=()):
+        """Пише лише змінені рядки"""
+        if not changed and not removed:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO records (name, key, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, key) DO UPDATE SET value = excluded.value",
+                    [(name, key, json.dumps(value, ensure_ascii=False)) for key, value in changed.items()]
+                )
+                self._conn.executemany(
+                    "DELETE FROM records WHERE name = ? AND key = ?",
+                    [(name, key) for key in removed]
+                )
+                self._conn.execute("COMMIT")
+            except:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def delete_records_before(self, name, cutoff):
+        """Видаляє записи з ключем < cutoff одним DELETE по первинному ключу"""
+        with self._lock:
+            self._conn.execute("DELETE FROM records WHERE name = ? AND key < ?", (name, cutoff))
+    
+    def try_acquire_lease(self, name, holder, ttl):
+        """Бере або продовжує оренду; True якщо вона наша"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+                (name, holder, now + ttl, now)
+            )
+            row = self._conn.execute("SELECT holder FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == holder
+    
+    def release_lease(self, name, holder):
+        """Віддає оренду раніше терміну (лише якщо вона наша)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    
+    def lease_alive(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM leases WHERE name = ? AND expires_at >= ?", (name, time.time())
+            ).fetchone()
+        return row is not None
+    
+    def enqueue_update(self, shard, payload):
+        with self._lock:
+            self._conn.execute("INSERT INTO inbox (shard, payload) VALUES (?, ?)", (shard, payload))
+    
+    def claim_updates(self, shard, limit=100):
+        """Забирає (і видаляє) найстаріші апдейти свого шарду"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload FROM inbox WHERE shard = ? ORDER BY id LIMIT ?",
+                    (shard, limit)
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        "DELETE FROM inbox WHERE shard = ? AND id <= ?",
+                        (shard, rows[-1][0])
+                    )
+                self._conn.execute("COMMIT")
+            except:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [payload for _, payload in rows]
+
+
+def create_storage():
+    if STORAGE_BACKEND == 'sqlite':
+        return SqliteStorage(STORAGE_PATH)
+    return JsonFileStorage()
+
+
+def slots_to_schedule(slots):
+    """48 півгодинних слотів (True - світло) -> [(год, хв, світло), ...]"""
+    schedule = []
+    for i, status in enumerate(slots):
+        if not schedule or schedule[-1][2] != status:
+            schedule.append((i // 2, (i % 2) * 30, status))
+    return schedule
+
+
+class SourceAdapter:
+    """Джерело графіків одного регіону: fetch() + parse().
+    
+    parse() повертає спільну модель {група: {дата: [(год, хв, світло), ...]}}.
+    fetch() блокуючий (requests); fetch і parse (BeautifulSoup) разом виконуються
+    в окремому потоці, щоб великі сторінки не блокували event loop.
+    """
+    
+    def __init__(self, region, url, timeout=SOURCE_TIMEOUT, **options):
+        self.region = region
+        self.url = url
+        self.timeout = timeout
+        self.options = options
+    
+    @property
+    def name(self):
+        return f"{self.region}:{type(self).__name__}"
+    
+    def fetch(self):
+        response = requests.get(self.url, timeout=self.timeout, headers={'User-Agent': 'power-schedule-bot'})
+        response.raise_for_status()
+        response.encoding = response.encoding or 'utf-8'
+        return response.text
+    
+    def parse(self, text):
+        raise NotImplementedError
+    
+    def fetch_and_parse(self):
+        return self.parse(self.fetch())
+    
+    async def poll(self):
+        return await asyncio.to_thread(self.fetch_and_parse)
+
+
+class HalfHourTableAdapter(SourceAdapter):
+    """HTML-таблиці на день: <table data-date="YYYY-MM-DD">, рядок на групу,
+    перша клітинка - назва групи, далі 48 (або 24) клітинок; клітинка з класом
+    off_class (за замовчуванням "off") - відключення.
+    """
+    
+    def parse(self, text):
+        off_class = self.options.get('off_class', 'off')
+        date_attr = self.options.get('date_attr', 'data-date')
+        result = {}
+        
+        soup = BeautifulSoup(text, 'html.parser')
+        for table in soup.find_all('table', attrs={date_attr: True}):
+            date_str = table[date_attr]
+            for row in table.find_all('tr'):
+                cells = row.find_all(['th', 'td'])
+                if len(cells) not in (25, 49):
+                    continue
+                
+                group = cells[0].get_text(strip=True)
+                slots = [off_class not in (cell.get('class') or []) for cell in cells[1:]]
+                if len(slots) == 24:
+                    slots = [status for status in slots for _ in range(2)]
+                
+                result.setdefault(group, {})[date_str] = slots_to_schedule(slots)
+        
+        return result
+
+
+class JsonFeedAdapter(SourceAdapter):
+    """JSON {група: {дата: [[год, хв, світло], ...]}} або /api/<група>/range цього ж бота"""
+    
+    def parse(self, text):
+        data = json.loads(text)
+        
+        if 'days' in data:
+            schedules = {}
+            for day in data['days']:
+                schedule = []
+                for period in day['periods']:
+                    h, m = map(int, period['start'].split(':'))
+                    schedule.append((h, m, bool(period['has_power'])))
+                schedules[day['date']] = schedule
+            return {data['group']: schedules}
+        
+        return {
+            group: {date_str: [tuple(p) for p in schedule] for date_str, schedule in days.items()}
+            for group, days in data.items()
+        }
+
+
+ADAPTER_TYPES = {
+    'table': HalfHourTableAdapter,
+    'json': JsonFeedAdapter,
+}
+
+
+def load_source_adapters(config=SOURCE_ADAPTERS):
+    if not config:
+        return []
+    
+    adapters = []
+    for item in json.loads(config):
+        item = dict(item)
+        adapter_cls = ADAPTER_TYPES[item.pop('type')]
+        adapters.append(adapter_cls(**item))
+    return adapters
+
+
+class SourcePoller:
+    """Опитує всі адаптери паралельно (з обмеженням), кожен зі своїм таймаутом.
+    
+    Помилка одного адаптера не впливає на інші: його останній вдалий результат
+    лишається в results, а метрики показують помилку і наскільки дані застарілі.
+    """
+    
+    def __init__(self, adapters, concurrency=SOURCE_CONCURRENCY):
+        self.adapters = adapters
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.results = {}
+        self.metrics = {
+            adapter.name: {
+                'successes': 0, 'failures': 0, 'last_success': None,
+                'last_error': None, 'last_latency_ms': None
+            }
+            for adapter in adapters
+        }
+    
+    async def _poll_one(self, adapter):
+        metrics = self.metrics[adapter.name]
+        await self._semaphore.acquire()
+        # Слот звільняється, коли потік справді завершився, а не на таймауті:
+        # інакше SOURCE_CONCURRENCY не обмежував би кількість живих потоків
+        task = asyncio.ensure_future(adapter.poll())
+        task.add_done_callback(lambda _: self._semaphore.release())
+        
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), adapter.timeout)
+        except Exception as e:
+            if not task.done():
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            metrics['failures'] += 1
+            metrics['last_error'] = f"{type(e).__name__}: {e}"
+            logger.warning(f"⚠️ Джерело {adapter.name}: {metrics['last_error']}")
+            return
+        finally:
+            metrics['last_latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+        
+        metrics['successes'] += 1
+        metrics['last_success'] = time.time()
+        metrics['last_error'] = None
+        self.results[adapter.region] = result
+    
+    async def poll_all(self):
+        await asyncio.gather(*(self._poll_one(adapter) for adapter in self.adapters))
+        return self.results
+    
+    def snapshot(self):
+        now = time.time()
+        return {
+            name: dict(m, freshness_seconds=round(now - m['last_success']) if m['last_success'] else None)
+            for name, m in self.metrics.items()
+        }
+
+
+class UserSettingsStore:
+    """Налаштування користувачів: обмежений LRU в пам'яті поверх сховища.
+    
+    - запис завантажується лише при першому зверненні користувача
+    - зміни накопичуються і пишуться пачкою (flush)
+    - витіснений змінений запис чекає на flush у _pending, тож нічого не губиться
+    - промах кешу з event loop - через get_async (читання сховища в потоці)
+    
+    На json-бекенді промах читає весь файл user_settings; для великої кількості
+    користувачів потрібен STORAGE_BACKEND=sqlite (читання одного рядка).
+    """
+    
+    def __init__(self, storage, capacity=USER_CACHE_SIZE):
+        self.storage = storage
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'loads': 0, 'evictions': 0, 'flushed': 0}
+    
+    def _load(self, key):
+        if key in self._pending:
+            return self._pending.pop(key), True
+        self.counters['loads'] += 1
+        return self.storage.load_record(USER_SETTINGS, key) or {}, False
+    
+    def _entry(self, user_id):
+        key = str(user_id)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self.counters['hits'] += 1
+            self._cache.move_to_end(key)
+            return key, entry
+        
+        entry, dirty = self._load(key)
+        self._cache[key] = entry
+        if dirty:
+            self._dirty.add(key)
+        
+        while len(self._cache) > self.capacity:
+            old_key, old_entry = self._cache.popitem(last=False)
+            self.counters['evictions'] += 1
+            if old_key in self._dirty:
+                self._dirty.discard(old_key)
+                self._pending[old_key] = old_entry
+        
+        return key, entry
+    
+    def get(self, user_id):
+        with self._lock:
+            _, entry = self._entry(user_id)
+            return dict(DEFAULT_USER_SETTINGS, **entry)
+    
+    async def get_async(self, user_id):
+        """Для handler-ів: хіт - одразу, промах - читання сховища поза event loop"""
+        with self._lock:
+            entry = self._cache.get(str(user_id))
+            if entry is not None:
+                self.counters['hits'] += 1
+                self._cache.move_to_end(str(user_id))
+                return dict(DEFAULT_USER_SETTINGS, **entry)
+        return await asyncio.to_thread(self.get, user_id)
+    
+    def update(self, user_id, **changes):
+        with self._lock:
+            key, entry = self._entry(user_id)
+            entry.update(changes)
+            self._dirty.add(key)
+            return dict(DEFAULT_USER_SETTINGS, **entry)
+    
+    def flush(self):
+        """Пише всі змінені записи однією пачкою"""
+        with self._lock:
+            batch = dict(self._pending)
+            for key in self._dirty:
+                batch[key] = dict(self._cache[key])
+            self._pending = {}
+            self._dirty = set()
+        
+        if not batch:
+            return 0
+        
+        try:
+            self.storage.save_records(USER_SETTINGS, batch)
+        except Exception:
+            # Не вдалось - повертаємо в чергу, спробуємо наступного разу
+            with self._lock:
+                for key, entry in batch.items():
+                    if key in self._cache:
+                        self._dirty.add(key)
+                    else:
+                        self._pending.setdefault(key, entry)
+            raise
+        
+        self.counters['flushed'] += len(batch)
+        return len(batch)
+    
+    def snapshot(self):
+        return dict(self.counters, cached=len(self._cache), dirty=len(self._dirty), pending=len(self._pending))
+
+
+class ScheduleApiServer:
+    """Маленький read-only HTTP API поверх індексу графіків.
+    
+    GET /api/<група>/today
+    GET /api/<група>/tomorrow
+    GET /api/<група>/range?from=2026-02-14&to=2026-02-20
+    GET /api/<група>/calendar.ics
+    
+    Відповіді серіалізуються один раз на версію графіка (і день для today/tomorrow)
+    і віддаються з сильним ETag; If-None-Match -> 304 без тіла. Ключ кешу - вже
+    розібраний і обрізаний по наявних днях діапазон, сам кеш обмежений (LRU).
+    """
+    
+    REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+    KEEPALIVE_TIMEOUT = 15
+    MAX_HEADERS = 64
+    
+    def __init__(self, bot, host=HTTP_API_HOST, port=HTTP_API_PORT):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.server = None
+        self._cache = OrderedDict()
+        self._cache_version = None
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"🌐 HTTP API: http://{self.host}:{self.port}/api/3.1/today")
+    
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+    
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    # Таймаут на весь запит (рядок + заголовки), не лише на перший рядок
+                    request = await asyncio.wait_for(self._read_request(reader), self.KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+                request_line, headers = request
+                
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, response_headers, body = self.handle_request(method, target, headers)
+                
+                head = [f"HTTP/1.1 {status} {self.REASONS[status]}"]
+                for name, value in response_headers.items():
+                    head.append(f"{name}: {value}")
+                head.append(f"Content-Length: {len(body)}")
+                head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_request(self, reader):
+        """(рядок запиту, заголовки) або None - кінець з'єднання чи забагато заголовків"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        
+        headers = {}
+        for _ in range(self.MAX_HEADERS + 1):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            return None
+        
+        return request_line, headers
+    
+    def handle_request(self, method, target, headers):
+        """Повертає (статус, заголовки, тіло)"""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        
+        if target == '/metrics':
+            body = json.dumps(self.bot.get_metrics(), separators=(',', ':')).encode('utf-8')
+            return 200, {'Content-Type': 'application/json', 'Cache-Control': 'no-store'}, body
+        
+        entry = self.get_entry(target)
+        if entry is None:
+            return 404, {'Content-Type': 'application/json'}, b'{"error":"not found"}'
+        if entry == 'bad':
+            return 400, {'Content-Type': 'application/json'}, b'{"error":"bad request"}'
+        
+        body, etag, content_type = entry
+        response_headers = {
+            'ETag': etag,
+            'Cache-Control': 'public, max-age=60',
+            'Access-Control-Allow-Origin': '*',
+        }
+        
+        if_none_match = headers.get('if-none-match')
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            if '*' in tags or etag in tags:
+                return 304, response_headers, b''
+        
+        response_headers['Content-Type'] = content_type
+        return 200, response_headers, body
+    
+    def get_entry(self, target):
+        """(тіло, etag, content-type) з кешу або None/'bad'"""
+        index = self.bot.index
+        today = self.bot.get_kyiv_time().date()
+        
+        if self._cache_version != (index.version, today):
+            self._cache = OrderedDict()
+            self._cache_version = (index.version, today)
+        
+        url = urlsplit(target)
+        parts = [p for p in unquote(url.path).split('/') if p]
+        if len(parts) != 3 or parts[0] != 'api' or parts[1] != '3.1':
+            return None
+        group, view = parts[1], parts[2]
+        
+        dates = None
+        if view == 'range':
+            query = parse_qs(url.query)
+            from_arg = query.get('from', [''])[0]
+            to_arg = query.get('to', [''])[0]
+            from_str = self.bot.parse_date_arg(from_arg) if from_arg else today.strftime('%Y-%m-%d')
+            to_str = self.bot.parse_date_arg(to_arg) if to_arg else '9999-12-31'
+            if not from_str or not to_str:
+                return 'bad'
+            dates = index.range(from_str, to_str)
+            key = (group, view, dates[0], dates[-1]) if dates else (group, view)
+        elif view in ('today', 'tomorrow', 'calendar.ics'):
+            key = (group, view)
+        else:
+            return None
+        
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            return entry
+        
+        entry = self._build_entry(group, view, dates, today)
+        self._cache[key] = entry
+        if len(self._cache) > API_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return entry
+    
+    def _build_entry(self, group, view, dates, today):
+        if view == 'today':
+            data = self._day(group, today.strftime('%Y-%m-%d'))
+        elif view == 'tomorrow':
+            data = self._day(group, (today + timedelta(days=1)).strftime('%Y-%m-%d'))
+        elif view == 'range':
+            data = {
+                'group': group,
+                'version': self.bot.index.version,
+                'days': [self._day(group, d) for d in dates]
+            }
+        else:
+            return self._seal(self.build_ics(group).encode('utf-8'), 'text/calendar; charset=utf-8')
+        
+        body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._seal(body, 'application/json; charset=utf-8')
+    
+    def _day(self, group, date_str):
+        return {'group': group, 'date': date_str, 'periods': self.bot.get_day_periods(date_str)}
+    
+    @staticmethod
+    def _seal(body, content_type):
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        return body, etag, content_type
+    
+    def build_ics(self, group):
+        """iCalendar з вікнами відключень (сусідні через північ зливаються)"""
+        index = self.bot.index
+        stats = self.bot.load_stats()
+        windows = []
+        
+        for date_str in index.dates:
+            day_start = datetime.strptime(date_str, '%Y-%m-%d').replace(tzinfo=KYIV_TZ)
+            # DTSTAMP - коли день змінився, а не коли стартував процес: ETag стабільний
+            updated_at = stats.get(date_str, {}).get('updated_at')
+            stamp = datetime.fromisoformat(updated_at) if updated_at else day_start
+            for start_min, end_min, status in index.periods(date_str):
+                if status:
+                    continue
+                start = day_start + timedelta(minutes=start_min)
+                end = day_start + timedelta(minutes=end_min)
+                if windows and windows[-1][1] == start:
+                    windows[-1][1] = end
+                    windows[-1][2] = max(windows[-1][2], stamp)
+                else:
+                    windows.append([start, end, stamp])
+        
+        def ics_time(dt):
+            return dt.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//power-schedule//UA",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:Відключення - Група {group}",
+        ]
+        for start, end, stamp in windows:
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{ics_time(start)}-{group}@power-schedule",
+                f"DTSTAMP:{ics_time(stamp)}",
+                f"DTSTART:{ics_time(start)}",
+                f"DTEND:{ics_time(end)}",
+                f"SUMMARY:🔴 Відключення (група {group})",
+                "END:VEVENT",
+            ]
+        lines.append("END:VCALENDAR")
+        return "\r\n".join(lines) + "\r\n"
+
+
 class PowerScheduleBot:
-    def __init__(self, bot_token):
+    def __init__(self, bot_token, clock=None, schedules=None, storage=None):
         self.bot_token = bot_token
+        # Годинник можна підмінити (симулятор), за замовчуванням - реальний час Києва
+        self.clock = clock or (lambda: datetime.now(KYIV_TZ))
+        self.alert_lead_minutes = ALERT_LEAD_MINUTES
         self.base_url = "https://off.energy.mk.ua/"
         self.stats_file = "weekly_stats.json"
         self.history_file = "power_history.json"
         self.group_chat_file = "group_chat.json"
         
+        # Спільний стан: читається/пишеться через сховище під локом,
+        # matplotlib (pyplot) не потокобезпечний - окремий лок на рендер
+        self.storage = storage or create_storage()
+        self.worker_index = WORKER_INDEX
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{self.worker_index}"
+        self.is_leader = False
+        # Шарди, чий inbox зараз обробляє цей воркер (свій + підхоплені)
+        self.owned_shards = set()
+        self._from_inbox = set()
+        self._state_lock = threading.RLock()
+        # Сховище налаштувань готове, але ще не підключене до команд і виводу:
+        # /settings і періодичний flush з'являться разом із першим реальним налаштуванням
+        self.users = UserSettingsStore(self.storage)
+        self._render_lock = threading.Lock()
+        self._group_chat_id = None
+        self._group_chat_id_loaded = False
+        self._group_chat_id_checked = 0.0
+        
         # ========================================
         # 📌 ТІЛЬКИ ЦЕ ТРЕБА МІНЯТИ! 
         # Після зміни - бот автоматично надішле в групу
@@ -56,8 +1680,38 @@ class PowerScheduleBot:
             # ],
         }
         
+        if schedules is not None:
+            self.schedules = dict(schedules)
+        
+        self.index = ScheduleIndex()
+        self._day_blocks = {}
+        self._interval_index = None
+        self.snapshot_publisher = SnapshotPublisher(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+        self.api_server = None
+        self.outbound = OutboundDispatcher()
+        
+        # Графіки з джерел у спільній моделі: "регіон:група" -> {дата: [(год, хв, світло), ...]}
+        self.region_schedules = {}
+        self.source_poller = None
+        
+        # Статистика: (ключ статистики, file_id, байти) останньої вдалої картинки
+        self._stats_image = None
+        self._stats_cooldown = {}
+        self._renders_in_flight = 0
+        self.image_metrics = {'images': 0, 'raw_bytes': 0, 'bytes': 0, 'encode_ms': 0.0, 'last': None}
+        self.stats_counters = {
+            'rendered': 0, 'cache_hits': 0, 'shed_cooldown': 0, 'shed_budget': 0,
+            'degraded_image': 0, 'degraded_text': 0, 'peak_renders': 0
+        }
+        self._background_tasks = []
+        
+        # Inline-відповіді, зібрані наперед на поточну хвилину
+        self._inline_key = None
+        self._inline_results = {}
+        
         self.init_history()
         self.cleanup_old_days()
+        self.reload_schedules()
         
         # Перевіряємо чи змінився графік
         old_schedules = self.load_old_schedules()
@@ -68,49 +1722,64 @@ class PowerScheduleBot:
             self.schedule_changed = True
             logger.info("🔔 ГРАФІК ЗМІНИВСЯ!")
             self.save_old_schedules()
+            # Розсилку робить лідер (може бути інший воркер)
+            self._write_json('pending_broadcast.json', {'digest': ScheduleIndex.digest_all(self.schedules)})
         else:
             self.schedule_changed = False
             logger.info("ℹ️ Графік без змін")
         
         self.auto_sync_stats()
+        # На старті - завжди: файла знімка може не бути (новий шлях, tmpfs після ребуту)
+        self.publish_snapshot()
+    
+    def _read_json(self, path, default):
+        with self._state_lock:
+            try:
+                return self.storage.load(path, default)
+            except Exception as e:
+                logger.error(f"Помилка: {e}")
+                return default
+    
+    def _write_json(self, path, data):
+        with self._state_lock:
+            self.storage.save(path, data)
     
     def load_group_chat_id(self):
-        try:
-            with open(self.group_chat_file, 'r') as f:
-                data = json.load(f)
-                chat_id = data.get('group_chat_id')
-                if chat_id:
-                    logger.info(f"📖 ID групи: {chat_id}")
-                    return chat_id
-        except:
-            pass
-        return None
+        with self._state_lock:
+            # Іншій воркер міг зберегти нову групу - у спільному сховищі кеш живе GROUP_CHAT_ID_TTL
+            stale = self.storage.shared and time.monotonic() - self._group_chat_id_checked > GROUP_CHAT_ID_TTL
+            if not self._group_chat_id_loaded or stale:
+                data = self._read_json(self.group_chat_file, {})
+                self._group_chat_id = data.get('group_chat_id') if isinstance(data, dict) else None
+                if self._group_chat_id and not self._group_chat_id_loaded:
+                    logger.info(f"📖 ID групи: {self._group_chat_id}")
+                self._group_chat_id_loaded = True
+                self._group_chat_id_checked = time.monotonic()
+            return self._group_chat_id
     
     def save_group_chat_id(self, chat_id):
-        try:
-            with open(self.group_chat_file, 'w') as f:
-                json.dump({'group_chat_id': chat_id}, f)
-            logger.info(f"💾 ЗБЕРЕЖЕНО ID: {chat_id}")
-        except Exception as e:
-            logger.error(f"❌ Помилка: {e}")
+        with self._state_lock:
+            try:
+                self._write_json(self.group_chat_file, {'group_chat_id': chat_id})
+                self._group_chat_id = chat_id
+                self._group_chat_id_loaded = True
+                self._group_chat_id_checked = time.monotonic()
+                logger.info(f"💾 ЗБЕРЕЖЕНО ID: {chat_id}")
+            except Exception as e:
+                logger.error(f"❌ Помилка: {e}")
     
     def load_old_schedules(self):
-        try:
-            with open('old_schedules.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
+        return self._read_json('old_schedules.json', {})
     
     def save_old_schedules(self):
         try:
-            with open('old_schedules.json', 'w', encoding='utf-8') as f:
-                json.dump(self.schedules, f, ensure_ascii=False, indent=2)
+            self._write_json('old_schedules.json', self.schedules)
         except Exception as e:
             logger.error(f"Помилка: {e}")
     
     async def send_schedule_to_group(self, application, test_mode=False):
         """Надсилає графік в групу"""
-        group_chat_id = self.load_group_chat_id()
+        group_chat_id = await asyncio.to_thread(self.load_group_chat_id)
         
         if not group_chat_id:
             logger.warning("⚠️ ID групи відсутній")
@@ -121,60 +1790,155 @@ class PowerScheduleBot:
         now = self.get_kyiv_time()
         
         if test_mode:
-            msg = "🧪 <b>ТЕСТ - Графік відключень</b>\n\n"
+            header = "🧪 <b>ТЕСТ - Графік відключень</b>\n\n"
         else:
-            msg = "🔔 <b>УВАГА! Графік відключень оновлено!</b>\n\n"
-        
-        msg += f"📅 {now.strftime('%d.%m.%Y %H:%M')}\n\n"
+            header = "🔔 <b>УВАГА! Графік відключень оновлено!</b>\n\n"
         
-        dates = sorted(self.schedules.keys())
-        shown = 0
-        for date_str in dates:
-            if shown >= 3:
-                break
-            
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            if date_obj.date() >= now.date():
-                schedule = self.schedules[date_str]
-                
-                day_name = {
-                    'Mon': 'Понеділок', 'Tue': 'Вівторок', 'Wed': 'Середа',
-                    'Thu': 'Четвер', 'Fri': "П'ятниця", 'Sat': 'Субота', 'Sun': 'Неділя'
-                }.get(date_obj.strftime('%a'), '')
-                
-                msg += f"📆 <b>{day_name} ({date_obj.strftime('%d.%m')})</b>\n"
-                
-                for i, (h, m, status) in enumerate(schedule):
-                    if i + 1 < len(schedule):
-                        next_h, next_m, _ = schedule[i + 1]
-                        end_time = f"{next_h:02d}:{next_m:02d}"
-                    else:
-                        end_time = "00:00"
-                    
-                    emoji = "🟢" if status else "🔴"
-                    status_text = "Світло" if status else "Відключення"
-                    
-                    msg += f"  {emoji} {h:02d}:{m:02d}-{end_time} - {status_text}\n"
-                
-                msg += "\n"
-                shown += 1
+        header += f"📅 {now.strftime('%d.%m.%Y %H:%M')}\n\n"
         
-        msg += "⚡ Група 3.1"
+        dates = self.index.range(now.strftime('%Y-%m-%d'), '9999-12-31')
+        blocks = [self.render_day_block(date_str) + "\n" for date_str in dates]
+        messages = split_message(blocks, header=header, footer="⚡ Група 3.1")
         
         try:
-            await application.bot.send_message(
-                chat_id=group_chat_id,
-                text=msg,
-                parse_mode='HTML'
-            )
-            logger.info("✅ НАДІСЛАНО!")
+            for msg in messages:
+                await self.send_message(
+                    application,
+                    group_chat_id,
+                    msg,
+                    parse_mode='HTML'
+                )
+            logger.info(f"✅ НАДІСЛАНО! ({len(messages)} повідомл.)")
             return True
         except Exception as e:
             logger.error(f"❌ ПОМИЛКА: {e}")
             return False
     
+    def reload_schedules(self):
+        """Перебудовує індекс після зміни self.schedules"""
+        changed, removed = self.index.rebuild(self.schedules)
+        
+        for date_str in changed + removed:
+            self._day_blocks.pop(date_str, None)
+        
+        return changed, removed
+    
+    def set_day_schedule(self, date_str, schedule, sync=True):
+        """Змінює графік одного дня: індекс, кеш і статистика - лише для нього.
+        sync=False - статистику перераховує викликач одним auto_sync_stats на пакет.
+        Знімок не публікується - це робить викликач один раз на весь пакет."""
+        if schedule is None:
+            self.schedules.pop(date_str, None)
+            changed = self.index.remove_day(date_str)
+        else:
+            self.schedules[date_str] = schedule
+            changed = self.index.update_day(date_str, schedule)
+        
+        if changed:
+            self._day_blocks.pop(date_str, None)
+        
+        if changed and sync:
+            if schedule is None:
+                self.auto_sync_stats(changed=[], removed=[date_str])
+            else:
+                self.auto_sync_stats(changed=[date_str], removed=[])
+        
+        return changed
+    
+    def render_day_block(self, date_str):
+        """HTML-блок одного дня (кешується за дайджестом графіка)"""
+        digest = self.index.digests.get(date_str)
+        cached = self._day_blocks.get(date_str)
+        if cached is not None and cached[0] == digest:
+            return cached[1]
+        
+        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+        day_name = DAY_NAMES.get(date_obj.strftime('%a'), '')
+        
+        block = f"📆 <b>{day_name} ({date_obj.strftime('%d.%m')})</b>\n"
+        
+        for start_min, end_min, status in self.index.periods(date_str) or []:
+            emoji = "🟢" if status else "🔴"
+            status_text = "Світло" if status else "Відключення"
+            start_time = f"{start_min // 60:02d}:{start_min % 60:02d}"
+            end_time = "00:00" if end_min >= 24 * 60 else f"{end_min // 60:02d}:{end_min % 60:02d}"
+            block += f"  {emoji} {start_time}-{end_time} - {status_text}\n"
+        
+        self._day_blocks[date_str] = (digest, block)
+        return block
+    
+    def parse_date_arg(self, text):
+        """'2026-02-14', '14.02.2026' або '14.02' -> '2026-02-14'"""
+        text = text.strip()
+        for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+            try:
+                return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+        # Без року - одразу з поточним (strptime узяв би 1900 і відкинув 29.02)
+        match = re.fullmatch(r'(\d{1,2})\.(\d{1,2})', text)
+        if not match:
+            return None
+        try:
+            day, month = int(match.group(1)), int(match.group(2))
+            return datetime(self.get_kyiv_time().year, month, day).strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+    
+    def parse_date_range(self, arg):
+        """'14.02..20.02' або '14.02' -> (from, to) або None; '28.12..03.01' - через Новий рік"""
+        if ".." in arg:
+            from_arg, to_arg = arg.split("..", 1)
+        else:
+            from_arg = to_arg = arg
+        
+        from_str = self.parse_date_arg(from_arg)
+        to_str = self.parse_date_arg(to_arg)
+        if not from_str or not to_str:
+            return None
+        
+        if to_str < from_str and re.fullmatch(r'\d{1,2}\.\d{1,2}', to_arg.strip()):
+            to_date = datetime.strptime(to_str, '%Y-%m-%d')
+            try:
+                to_str = to_date.replace(year=to_date.year + 1).strftime('%Y-%m-%d')
+            except ValueError:
+                return None
+        
+        if from_str > to_str:
+            return None
+        return from_str, to_str
+    
+    def get_range_pages(self, from_str, to_str):
+        """Сторінки графіка за проміжок, кожна влазить в одне повідомлення"""
+        dates = self.index.range(from_str, to_str)
+        if not dates:
+            return []
+        
+        header_from = datetime.strptime(dates[0], '%Y-%m-%d').strftime('%d.%m')
+        header_to = datetime.strptime(dates[-1], '%Y-%m-%d').strftime('%d.%m')
+        header = f"⚡️ <b>Графік {header_from} - {header_to}</b>\n\n"
+        footer = "📍 Група: 3.1"
+        
+        blocks = [self.render_day_block(date_str) + "\n" for date_str in dates]
+        # Хедер/футер є на кожній сторінці, тому пакуємо з запасом під них
+        limit = TELEGRAM_MESSAGE_LIMIT - telegram_len(header) - telegram_len(footer)
+        pages = split_message(blocks, limit=limit, max_blocks=RANGE_PAGE_DAYS)
+        return [header + page + footer for page in pages]
+    
+    def get_range_keyboard(self, from_str, to_str, page, total):
+        if total <= 1:
+            return None
+        
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("◀️", callback_data=f"sched:{from_str}:{to_str}:{page - 1}"))
+        buttons.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data="sched:noop"))
+        if page + 1 < total:
+            buttons.append(InlineKeyboardButton("▶️", callback_data=f"sched:{from_str}:{to_str}:{page + 1}"))
+        return InlineKeyboardMarkup([buttons])
+    
     def init_history(self):
-        if not os.path.exists(self.history_file):
+        if self._read_json(self.history_file, None) is None:
             history = {
                 "last_check": None,
                 "current_status": None,
@@ -183,66 +1947,102 @@ class PowerScheduleBot:
             self.save_history(history)
     
     def load_history(self):
-        try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {
-                "last_check": None,
-                "current_status": None,
-                "status_since": None
-            }
+        return self._read_json(self.history_file, {
+            "last_check": None,
+            "current_status": None,
+            "status_since": None
+        })
     
     def save_history(self, history):
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
+            self._write_json(self.history_file, history)
         except Exception as e:
             logger.error(f"Помилка: {e}")
     
     def update_history(self):
         now = self.get_kyiv_time()
         current = self.get_current_status()
-        history = self.load_history()
         
         if current['status'] is None:
             return
         
-        if history['current_status'] != current['status']:
-            history['current_status'] = current['status']
-            history['status_since'] = now.isoformat()
-            self.save_history(history)
+        with self._state_lock:
+            history = self.load_history()
+            if history['current_status'] != current['status']:
+                history['current_status'] = current['status']
+                history['status_since'] = now.isoformat()
+                self.save_history(history)
+    
+    def get_day_slots(self, date_str):
+        """48 півгодинних статусів дня рядком: '1' - світло, '0' - відключення"""
+        slots = ['1'] * 48
+        for start_min, end_min, status in self.index.periods(date_str):
+            for slot in range(-(-start_min // 30), min(48, -(-end_min // 30))):
+                slots[slot] = '1' if status else '0'
+        return ''.join(slots)
+    
+    def archive_day_slots(self, dates):
+        """Архів не чиститься разом зі старими днями - з нього будується /heatmap.
+        Дні старші за ARCHIVE_DAYS видаляються, тож архів (і перезапис json) обмежений."""
+        if not dates:
+            return
+        cutoff = (self.get_kyiv_time() - timedelta(days=ARCHIVE_DAYS)).strftime('%Y-%m-%d')
+        with self._state_lock:
+            try:
+                self.storage.save_records(STATUS_ARCHIVE, {d: self.get_day_slots(d) for d in dates})
+                self.storage.delete_records_before(STATUS_ARCHIVE, cutoff)
+            except Exception as e:
+                logger.error(f"Помилка: {e}")
     
-    def auto_sync_stats(self):
-        stats = {}
+    def compute_day_stats(self, date_str):
+        hours_with = 0
+        hours_without = 0
         
-        for date_str, schedule in self.schedules.items():
-            hours_with = 0
-            hours_without = 0
+        for start_min, end_min, status in self.index.periods(date_str):
+            duration = (end_min - start_min) / 60
             
-            for i, (h, m, status) in enumerate(schedule):
-                start_min = h * 60 + m
-                
-                if i + 1 < len(schedule):
-                    next_h, next_m, _ = schedule[i + 1]
-                    end_min = next_h * 60 + next_m
-                else:
-                    end_min = 24 * 60
-                
-                duration = (end_min - start_min) / 60
-                
-                if status:
-                    hours_with += duration
-                else:
-                    hours_without += duration
-            
-            stats[date_str] = {
-                'hours_with_power': round(hours_with, 1),
-                'hours_without_power': round(hours_without, 1)
-            }
+            if status:
+                hours_with += duration
+            else:
+                hours_without += duration
         
-        self.save_stats(stats)
-        logger.info(f"✅ Статистика: {len(stats)} днів")
+        return {
+            'hours_with_power': round(hours_with, 1),
+            'hours_without_power': round(hours_without, 1),
+            'digest': self.index.digests[date_str],
+            # Коли день востаннє змінився - стабільний між перезапусками (DTSTAMP в ICS)
+            'updated_at': self.get_kyiv_time().isoformat()
+        }
+    
+    def auto_sync_stats(self, changed=None, removed=None):
+        """Інкрементальна статистика: перераховуються лише дні зі зміненим дайджестом.
+        
+        Без аргументів (старт) - порівнює дайджести зі збереженими записами;
+        з аргументами - обробляє тільки передані дні.
+        """
+        if changed is None or removed is None:
+            stored = self.load_stats()
+            changed = [
+                d for d in self.index.dates
+                if stored.get(d, {}).get('digest') != self.index.digests[d]
+            ]
+            removed = [d for d in stored if d not in self.index.digests]
+        
+        records = {date_str: self.compute_day_stats(date_str) for date_str in changed}
+        self.save_stats(records, removed)
+        self.archive_day_slots(changed)
+        
+        logger.info(f"✅ Статистика: {len(self.index.dates)} днів (оновлено {len(records)}, видалено {len(removed)})")
+    
+    def publish_snapshot(self):
+        """Публікує знімок для інших процесів - раз на пакет змін, не на кожен день"""
+        if not self.snapshot_publisher:
+            return
+        try:
+            generation = self.snapshot_publisher.publish(self.index, self.load_stats())
+            logger.info(f"🧊 Знімок: генерація {generation}")
+        except Exception as e:
+            logger.error(f"❌ Знімок: {e}")
     
     def cleanup_old_days(self):
         now = self.get_kyiv_time()
@@ -257,18 +2057,19 @@ class PowerScheduleBot:
             del self.schedules[date_str]
     
     def load_stats(self):
-        try:
-            with open(self.stats_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
+        with self._state_lock:
+            try:
+                return self.storage.load_records(self.stats_file)
+            except Exception as e:
+                logger.error(f"Помилка: {e}")
+                return {}
     
-    def save_stats(self, stats):
-        try:
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(stats, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Помилка: {e}")
+    def save_stats(self, changed, removed=()):
+        with self._state_lock:
+            try:
+                self.storage.save_records(self.stats_file, changed, removed)
+            except Exception as e:
+                logger.error(f"Помилка: {e}")
     
     def get_main_keyboard(self):
         keyboard = [
@@ -280,7 +2081,7 @@ class PowerScheduleBot:
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     
     def get_kyiv_time(self):
-        return datetime.now(KYIV_TZ)
+        return self.clock()
     
     def get_schedule_for_date(self, date_str):
         return self.schedules.get(date_str)
@@ -336,55 +2137,56 @@ class PowerScheduleBot:
         return periods[0]
     
     def get_real_power_on_time(self):
-        history = self.load_history()
-        now = self.get_kyiv_time()
-        current = self.get_current_status()
-        
-        if current['status'] is None:
-            return now
-        
-        if history.get('status_since') and history.get('current_status') == current['status']:
-            try:
-                status_since = datetime.fromisoformat(history['status_since'])
-                if now - status_since < timedelta(days=2):
-                    return status_since
-            except:
-                pass
-        
-        today_str = now.strftime('%Y-%m-%d')
-        schedule = self.get_schedule_for_date(today_str)
-        
-        if not schedule:
-            return now
+        with self._state_lock:
+            history = self.load_history()
+            now = self.get_kyiv_time()
+            current = self.get_current_status()
         
-        current_minutes = now.hour * 60 + now.minute
+            if current['status'] is None:
+                return now
         
-        last_change = None
-        for h, m, status in schedule:
-            period_min = h * 60 + m
-            if status == current['status'] and period_min <= current_minutes:
-                last_change = now.replace(hour=h, minute=m, second=0, microsecond=0)
+            if history.get('status_since') and history.get('current_status') == current['status']:
+                try:
+                    status_since = datetime.fromisoformat(history['status_since'])
+                    if now - status_since < timedelta(days=2):
+                        return status_since
+                except:
+                    pass
         
-        if last_change:
-            history['current_status'] = current['status']
-            history['status_since'] = last_change.isoformat()
-            self.save_history(history)
-            return last_change
+            today_str = now.strftime('%Y-%m-%d')
+            schedule = self.get_schedule_for_date(today_str)
         
-        yesterday = now - timedelta(days=1)
-        yesterday_str = yesterday.strftime('%Y-%m-%d')
-        schedule_yesterday = self.get_schedule_for_date(yesterday_str)
+            if not schedule:
+                return now
         
-        if schedule_yesterday:
-            for h, m, status in reversed(schedule_yesterday):
-                if status == current['status']:
-                    last_change = yesterday.replace(hour=h, minute=m, second=0, microsecond=0)
-                    history['current_status'] = current['status']
-                    history['status_since'] = last_change.isoformat()
-                    self.save_history(history)
-                    return last_change
+            current_minutes = now.hour * 60 + now.minute
         
-        return current['period_start_datetime'] if current['period_start_datetime'] else now
+            last_change = None
+            for h, m, status in schedule:
+                period_min = h * 60 + m
+                if status == current['status'] and period_min <= current_minutes:
+                    last_change = now.replace(hour=h, minute=m, second=0, microsecond=0)
+        
+            if last_change:
+                history['current_status'] = current['status']
+                history['status_since'] = last_change.isoformat()
+                self.save_history(history)
+                return last_change
+        
+            yesterday = now - timedelta(days=1)
+            yesterday_str = yesterday.strftime('%Y-%m-%d')
+            schedule_yesterday = self.get_schedule_for_date(yesterday_str)
+        
+            if schedule_yesterday:
+                for h, m, status in reversed(schedule_yesterday):
+                    if status == current['status']:
+                        last_change = yesterday.replace(hour=h, minute=m, second=0, microsecond=0)
+                        history['current_status'] = current['status']
+                        history['status_since'] = last_change.isoformat()
+                        self.save_history(history)
+                        return last_change
+        
+            return current['period_start_datetime'] if current['period_start_datetime'] else now
     
     def get_next_period(self):
         now = self.get_kyiv_time()
@@ -541,53 +2343,31 @@ class PowerScheduleBot:
             'without_power': total_without / 60
         }
     
+    def get_day_periods(self, date_str):
+        """Періоди дня у форматі get_full_schedule"""
+        periods = []
+        for start_min, end_min, status in self.index.periods(date_str) or []:
+            periods.append({
+                'start': f"{start_min // 60:02d}:{start_min % 60:02d}",
+                'end': "00:00" if end_min >= 24 * 60 else f"{end_min // 60:02d}:{end_min % 60:02d}",
+                'status': 'Є світло' if status else 'Відключення',
+                'has_power': status
+            })
+        return periods
+    
     def get_full_schedule(self):
         now = self.get_kyiv_time()
         today_str = now.strftime('%Y-%m-%d')
-        schedule_today = self.get_schedule_for_date(today_str)
         
         tomorrow = now + timedelta(days=1)
         tomorrow_str = tomorrow.strftime('%Y-%m-%d')
-        schedule_tomorrow = self.get_schedule_for_date(tomorrow_str)
         
-        result = {
+        return {
             'timestamp': now.isoformat(),
             'group': '3.1',
-            'today': {'date': today_str, 'periods': []},
-            'tomorrow': {'date': tomorrow_str, 'periods': []}
+            'today': {'date': today_str, 'periods': self.get_day_periods(today_str)},
+            'tomorrow': {'date': tomorrow_str, 'periods': self.get_day_periods(tomorrow_str)}
         }
-        
-        if schedule_today:
-            for i, (h, m, status) in enumerate(schedule_today):
-                if i + 1 < len(schedule_today):
-                    next_h, next_m, _ = schedule_today[i + 1]
-                    end_time = f"{next_h:02d}:{next_m:02d}"
-                else:
-                    end_time = "00:00"
-                
-                result['today']['periods'].append({
-                    'start': f"{h:02d}:{m:02d}",
-                    'end': end_time,
-                    'status': 'Є світло' if status else 'Відключення',
-                    'has_power': status
-                })
-        
-        if schedule_tomorrow:
-            for i, (h, m, status) in enumerate(schedule_tomorrow):
-                if i + 1 < len(schedule_tomorrow):
-                    next_h, next_m, _ = schedule_tomorrow[i + 1]
-                    end_time = f"{next_h:02d}:{next_m:02d}"
-                else:
-                    end_time = "00:00"
-                
-                result['tomorrow']['periods'].append({
-                    'start': f"{h:02d}:{m:02d}",
-                    'end': end_time,
-                    'status': 'Є світло' if status else 'Відключення',
-                    'has_power': status
-                })
-        
-        return result
     
     def get_hour_status(self, hour_decimal, date_str):
         schedule = self.get_schedule_for_date(date_str)
@@ -612,6 +2392,11 @@ class PowerScheduleBot:
         return True
     
     def generate_stats_image(self):
+        # pyplot тримає глобальний стан - рендеримо по одному
+        with self._render_lock:
+            return self._render_stats_image()
+    
+    def _render_stats_image(self):
         stats = self.load_stats()
         
         if not stats:
@@ -752,13 +2537,126 @@ class PowerScheduleBot:
         
         plt.tight_layout(pad=1.2)
         
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight', 
-                   facecolor='white', pad_inches=0.5)
-        buf.seek(0)
-        plt.close('all')
+        try:
+            return self.encode_figure(fig)
+        finally:
+            plt.close('all')
+    
+    def encode_figure(self, fig, name='stats', colors=None):
+        """Фігура matplotlib -> палітровий PNG, webp або jpeg.
+        
+        matplotlib віддає сирий RGBA (без проміжного PNG і його декодування),
+        encode_ms міряє весь вихідний етап: растр + стиснення.
+        """
+        started = time.perf_counter()
+        raw = io.BytesIO()
+        fig.savefig(raw, format='rgba', dpi=STATS_IMAGE_DPI, bbox_inches='tight',
+                    facecolor='white', pad_inches=0.5)
+        # bbox_inches='tight' змінює розмір полотна - він є лише в останнього рендерера
+        size_px = (int(fig.canvas.renderer.width), int(fig.canvas.renderer.height))
+        raw_bytes = len(raw.getbuffer())
+        if size_px[0] * size_px[1] * 4 != raw_bytes:
+            raise RuntimeError(f"Несподіваний розмір растра: {size_px}, {raw_bytes} байт")
+        
+        img = Image.frombuffer('RGBA', size_px, raw.getbuffer(), 'raw', 'RGBA', 0, 1).convert('RGB')
+        out = io.BytesIO()
+        
+        if STATS_IMAGE_FORMAT == 'webp':
+            if STATS_IMAGE_QUALITY >= 100:
+                img.save(out, format='WEBP', lossless=True, method=4)
+            else:
+                img.save(out, format='WEBP', quality=STATS_IMAGE_QUALITY, method=4)
+            ext = 'webp'
+        elif STATS_IMAGE_FORMAT in ('jpeg', 'jpg'):
+            img.save(out, format='JPEG', quality=STATS_IMAGE_QUALITY, optimize=True, progressive=True)
+            ext = 'jpg'
+        else:
+            # Графік - кілька плоских кольорів + згладжений текст, палітри вистачає
+            img = img.quantize(colors=colors or STATS_IMAGE_COLORS, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+            img.save(out, format='PNG', optimize=True)
+            ext = 'png'
+        
+        encode_ms = (time.perf_counter() - started) * 1000
+        out.name = f"{name}.{ext}"
+        out.seek(0)
+        
+        size = len(out.getvalue())
+        self.image_metrics['images'] += 1
+        self.image_metrics['raw_bytes'] += raw_bytes
+        self.image_metrics['bytes'] += size
+        self.image_metrics['encode_ms'] += encode_ms
+        self.image_metrics['last'] = {'format': ext, 'raw_bytes': raw_bytes, 'bytes': size, 'encode_ms': round(encode_ms, 1)}
+        logger.info(f"🖼️ {out.name}: {raw_bytes // 1024} КБ -> {size // 1024} КБ за {encode_ms:.0f} мс")
+        
+        return out
+    
+    def compute_heatmap(self, archive):
+        """{дата: '0101...'} -> (матриця 7x48 ймовірності відключення, днів на кожен день тижня)"""
+        dates = sorted(archive)
+        slots = np.frombuffer(''.join(archive[d] for d in dates).encode('ascii'), dtype=np.uint8)
+        off = (slots == ord('0')).reshape(len(dates), 48)
+        
+        # 1970-01-01 - четвер, тому (дні + 3) % 7 дає ПН=0 ... НД=6
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        weekdays = (days + 3) % 7
+        
+        cells = (weekdays[:, None] * 48 + np.arange(48)).ravel()
+        off_counts = np.bincount(cells, weights=off.ravel(), minlength=7 * 48).reshape(7, 48)
+        day_counts = np.bincount(weekdays, minlength=7)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probability = off_counts / day_counts[:, None]
+        probability[day_counts == 0] = np.nan
+        
+        return probability, day_counts
+    
+    def generate_heatmap_image(self):
+        archive = self.storage.load_records(STATUS_ARCHIVE)
+        if not archive:
+            return None
+        
+        probability, day_counts = self.compute_heatmap(archive)
+        dates = sorted(archive)
+        first = datetime.strptime(dates[0], '%Y-%m-%d').strftime('%d.%m.%Y')
+        last = datetime.strptime(dates[-1], '%Y-%m-%d').strftime('%d.%m.%Y')
         
-        return buf
+        with self._render_lock:
+            fig, ax = plt.subplots(figsize=(16, 6), facecolor='white')
+            
+            cmap = matplotlib.colormaps['RdYlGn_r'].copy()
+            cmap.set_bad('#CCCCCC')
+            image = ax.imshow(
+                np.ma.masked_invalid(probability), cmap=cmap, vmin=0, vmax=1,
+                aspect='auto', interpolation='nearest', extent=(0, 24, 7, 0)
+            )
+            
+            ax.set_title(
+                f"Ймовірність відключення {first} - {last} ({len(dates)} дн.)",
+                fontsize=17, color='#AAAAAA', pad=20, weight='normal'
+            )
+            ax.set_xticks(range(0, 25))
+            ax.set_xticklabels([str(i) for i in range(0, 25)], fontsize=10, color='#888888', weight='bold')
+            ax.set_yticks([i + 0.5 for i in range(7)])
+            ax.set_yticklabels(
+                [f"{WEEKDAY_SHORT[i]} ({day_counts[i]})" for i in range(7)],
+                fontsize=12, weight='bold', color='#333333'
+            )
+            ax.tick_params(length=0)
+            for spine in ax.spines.values():
+                spine.set_visible(False)
+            
+            colorbar = fig.colorbar(image, ax=ax, fraction=0.03, pad=0.02)
+            colorbar.set_ticks([0, 0.25, 0.5, 0.75, 1])
+            colorbar.set_ticklabels(['0%', '25%', '50%', '75%', '100%'])
+            colorbar.outline.set_visible(False)
+            
+            plt.tight_layout(pad=1.2)
+            
+            try:
+                # Градієнт - плоскої палітри замало, інакше видно смуги
+                return self.encode_figure(fig, name='heatmap', colors=max(STATS_IMAGE_COLORS, 64))
+            finally:
+                plt.close('all')
     
     def format_schedule_message(self, data):
         now = self.get_kyiv_time()
@@ -867,8 +2765,9 @@ class PowerScheduleBot:
         logger.info(f"📥 /start: {chat_type} | {chat_id} | {chat_title}")
         
         if chat_type in ['group', 'supergroup']:
-            self.save_group_chat_id(chat_id)
-            await update.message.reply_text(
+            await asyncio.to_thread(self.save_group_chat_id, chat_id)
+            await self.reply_text(
+                update,
                 f"✅ <b>Підключено!</b>\n\n"
                 f"ID групи: <code>{chat_id}</code>\n\n"
                 "Тепер я буду надсилати сюди сповіщення при оновленні графіка!",
@@ -883,7 +2782,8 @@ class PowerScheduleBot:
             "Використовуйте меню внизу 👇"
         )
         
-        await update.message.reply_text(
+        await self.reply_text(
+            update,
             welcome_text, 
             parse_mode='HTML', 
             reply_markup=self.get_main_keyboard()
@@ -897,9 +2797,9 @@ class PowerScheduleBot:
         success = await self.send_schedule_to_group(context.application, test_mode=True)
         
         if success:
-            await update.message.reply_text("✅ Тест успішний!")
+            await self.reply_text(update, "✅ Тест успішний!")
         else:
-            await update.message.reply_text("❌ Помилка. Перевірте логи Railway.")
+            await self.reply_text(update, "❌ Помилка. Перевірте логи Railway.")
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_type = update.effective_chat.type
@@ -908,84 +2808,606 @@ class PowerScheduleBot:
         if chat_type in ['group', 'supergroup']:
             saved_id = self.load_group_chat_id()
             if saved_id != chat_id:
-                self.save_group_chat_id(chat_id)
+                await asyncio.to_thread(self.save_group_chat_id, chat_id)
             return
         
         text = update.message.text
         
         if text == "⚡ Зараз є світло?":
             message = self.format_now_message()
-            await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
+            await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
         
         elif text == "📅 Повний графік":
             data = self.get_full_schedule()
             message = self.format_schedule_message(data)
-            await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard(), disable_web_page_preview=True)
+            await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard(), disable_web_page_preview=True)
         
         elif text == "⏱️ Таймер світла":
-            message = self.format_timer_message()
-            await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
+            # Читає/пише історію в сховищі - поза event loop
+            message = await asyncio.to_thread(self.format_timer_message)
+            await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
         
         elif text == "📊 Статистика":
-            await update.message.reply_text("🎨 Генерую статистику...", reply_markup=self.get_main_keyboard())
-            
-            image_buf = self.generate_stats_image()
-            
-            if image_buf:
-                await update.message.reply_photo(
-                    photo=image_buf,
-                    caption="📊 Графік відключень світла\nГрупа 3.1",
-                    reply_markup=self.get_main_keyboard()
-                )
-            else:
-                await update.message.reply_text(
-                    "❌ Статистики поки немає",
-                    reply_markup=self.get_main_keyboard()
-                )
+            await self.send_stats(update, reply_markup=self.get_main_keyboard())
         
         elif text == "🌐 Відкрити сайт":
-            await update.message.reply_text(
+            await self.reply_text(
+                update,
                 f"🌐 Офіційний сайт:\n{self.base_url}",
                 reply_markup=self.get_main_keyboard(),
                 disable_web_page_preview=True
             )
     
     async def schedule_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.args:
+            await self.schedule_range_command(update, context)
+            return
+        
         data = self.get_full_schedule()
         message = self.format_schedule_message(data)
-        await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard(), disable_web_page_preview=True)
+        await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard(), disable_web_page_preview=True)
+    
+    async def schedule_range_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/schedule 14.02..20.02 або /schedule 14.02"""
+        date_range = self.parse_date_range(" ".join(context.args))
+        
+        if not date_range:
+            await self.reply_text(
+                update,
+                "❌ Формат: <code>/schedule 14.02..20.02</code>",
+                parse_mode='HTML'
+            )
+            return
+        
+        from_str, to_str = date_range
+        pages = self.get_range_pages(from_str, to_str)
+        if not pages:
+            await self.reply_text(update, "❌ Графіків за цей період немає")
+            return
+        
+        await self.reply_text(
+            update,
+            pages[0],
+            parse_mode='HTML',
+            reply_markup=self.get_range_keyboard(from_str, to_str, 0, len(pages))
+        )
+    
+    async def schedule_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        parts = query.data.split(":")
+        
+        if len(parts) != 4:
+            await query.answer()
+            return
+        
+        _, from_str, to_str, page = parts
+        pages = self.get_range_pages(from_str, to_str)
+        page = int(page)
+        
+        if not pages:
+            await query.answer("Графіків за цей період вже немає")
+            return
+        
+        page = min(page, len(pages) - 1)
+        await query.answer()
+        await self.outbound.send(
+            LANE_LIVE,
+            update.effective_chat.id,
+            query.edit_message_text,
+            pages[page],
+            parse_mode='HTML',
+            reply_markup=self.get_range_keyboard(from_str, to_str, page, len(pages))
+        )
     
     async def now_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         message = self.format_now_message()
-        await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
+        await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text("🎨 Генерую статистику...")
+        await self.send_stats(update)
+    
+    def get_interval_index(self):
+        if self._interval_index is None or self._interval_index.version != self.index.version:
+            self._interval_index = IntervalIndex(self.index)
+        return self._interval_index
+    
+    def to_abs_minutes(self, dt):
+        return dt.date().toordinal() * 1440 + dt.hour * 60 + dt.minute
+    
+    def from_abs_minutes(self, minutes):
+        day = datetime.fromordinal(minutes // 1440).replace(tzinfo=KYIV_TZ)
+        return day + timedelta(minutes=minutes % 1440)
+    
+    def find_windows(self, duration_minutes, status=True, limit=WINDOW_RESULTS):
+        """Наступні вікна [(початок, кінець)] статусу довжиною >= duration_minutes"""
+        now = self.to_abs_minutes(self.get_kyiv_time())
+        found = self.get_interval_index().find(status, duration_minutes, now, limit)
+        return [(self.from_abs_minutes(start), self.from_abs_minutes(end)) for start, end in found]
+    
+    def find_longest(self, status=False, date_str=None):
+        """Найдовше вікно статусу за день (за замовчуванням - сьогодні)"""
+        day = datetime.strptime(date_str, '%Y-%m-%d') if date_str else self.get_kyiv_time()
+        day_start = day.date().toordinal() * 1440
+        found = self.get_interval_index().longest(status, day_start, day_start + 1440)
+        if not found:
+            return None
+        return self.from_abs_minutes(found[0]), self.from_abs_minutes(found[1])
+    
+    @staticmethod
+    def parse_duration(text):
+        """'3', '3h', '2.5год', '90m', '90хв', '1:30' -> хвилини"""
+        text = text.strip().lower().replace(',', '.')
+        match = re.fullmatch(r'(\d{1,2}):(\d{2})', text)
+        if match:
+            return int(match.group(1)) * 60 + int(match.group(2))
+        match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*(h|г|год|m|хв|min)?', text)
+        if not match:
+            return None
+        value = float(match.group(1))
+        if match.group(2) in ('m', 'хв', 'min'):
+            return int(value)
+        return int(value * 60)
+    
+    def format_duration(self, minutes):
+        h, m = divmod(int(minutes), 60)
+        return f"{h} год" if m == 0 else f"{h} год {m} хв"
+    
+    async def window_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/window 3h [on|off]"""
+        args = [a.lower() for a in context.args]
+        status = True
+        if args and args[-1] in ('on', 'off', 'світло', 'відключення'):
+            status = args.pop() in ('on', 'світло')
+        
+        duration = self.parse_duration(" ".join(args)) if args else None
+        if not duration:
+            await self.reply_text(
+                update,
+                "❌ Формат: <code>/window 3h on</code> або <code>/window 90m off</code>",
+                parse_mode='HTML'
+            )
+            return
         
-        image_buf = self.generate_stats_image()
+        windows = self.find_windows(duration, status)
+        emoji = "🟢" if status else "🔴"
+        what = "зі світлом" if status else "без світла"
+        
+        msg = f"🔎 <b>Вікна {what} від {self.format_duration(duration)}</b>\n\n"
+        if not windows:
+            msg += "❌ У відомому графіку таких немає\n"
+        for start, end in windows:
+            day_name = WEEKDAY_SHORT[start.weekday()]
+            msg += f"{emoji} {day_name} {start.strftime('%d.%m %H:%M')} → {end.strftime('%H:%M')}"
+            msg += f" ({self.format_duration((end - start).total_seconds() // 60)})\n"
+        
+        longest = self.find_longest(False)
+        if longest:
+            msg += f"\n🔴 Найдовше відключення сьогодні: {longest[0].strftime('%H:%M')}-{longest[1].strftime('%H:%M')}"
+            msg += f" ({self.format_duration((longest[1] - longest[0]).total_seconds() // 60)})\n"
+        
+        msg += "\n📍 Група: 3.1"
+        await self.reply_text(update, msg, parse_mode='HTML')
+    
+    async def heatmap_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.reserve_render():
+            self.stats_counters['shed_budget'] += 1
+            await self.reply_text(update, "⏳ Зараз багато запитів, спробуйте за хвилину")
+            return
         
-        if image_buf:
-            await update.message.reply_photo(
-                photo=image_buf,
-                caption="📊 Графік відключень світла\nГрупа 3.1",
-                reply_markup=self.get_main_keyboard()
-            )
+        try:
+            await self.reply_text(update, "🎨 Генерую теплову карту...")
+            image_buf = await asyncio.to_thread(self.generate_heatmap_image)
+        finally:
+            self.release_render()
+        
+        if not image_buf:
+            await self.reply_text(update, "❌ Статистики поки немає")
+            return
+        
+        await self.reply_photo(
+            update,
+            photo=image_buf,
+            caption="🗓️ Відключення по днях тижня і годинах\nГрупа 3.1",
+            reply_markup=self.get_main_keyboard()
+        )
+    
+    def reserve_render(self):
+        """Займає слот рендера в тому ж кроці, що й перевірка (до будь-якого await)"""
+        if self._renders_in_flight >= RENDER_BUDGET:
+            return False
+        self._renders_in_flight += 1
+        self.stats_counters['peak_renders'] = max(self.stats_counters['peak_renders'], self._renders_in_flight)
+        return True
+    
+    def release_render(self):
+        self._renders_in_flight -= 1
+    
+    def get_stats_key(self, stats):
+        raw = json.dumps(stats, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    
+    def format_stats_summary(self, stats):
+        """Текстова статистика - коли картинку зараз не малюємо"""
+        msg = "📊 <b>Статистика</b>\n\n"
+        for date_str in sorted(stats):
+            data = stats[date_str]
+            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            msg += f"<b>{date_obj.strftime('%d.%m')}</b>: "
+            msg += f"🟢 {data['hours_with_power']:.1f} год  🔴 {data['hours_without_power']:.1f} год\n"
+        msg += "\n📍 Група: 3.1"
+        return msg
+    
+    async def send_cached_stats_image(self, update, caption, reply_markup):
+        """Надсилає збережену картинку: file_id (без аплоаду) або байти"""
+        key, file_id, data = self._stats_image
+        photo = file_id or io.BytesIO(data)
+        message = await self.reply_photo(update, photo=photo, caption=caption, reply_markup=reply_markup)
+        if not file_id and message and message.photo and self._stats_image[0] == key:
+            self._stats_image = (key, message.photo[-1].file_id, data)
+    
+    async def send_stats(self, update, reply_markup=None):
+        """Статистика з контролем навантаження на рендер.
+        
+        Свіжа картинка з кешу -> одразу; інакше рендер, якщо є вільний слот
+        і користувач не в кулдауні. Якщо ні - остання вдала картинка або текст.
+        """
+        caption = "📊 Графік відключень світла\nГрупа 3.1"
+        stats = await asyncio.to_thread(self.load_stats)
+        
+        if not stats:
+            await self.reply_text(update, "❌ Статистики поки немає", reply_markup=reply_markup)
+            return
+        
+        key = self.get_stats_key(stats)
+        
+        if self._stats_image and self._stats_image[0] == key:
+            self.stats_counters['cache_hits'] += 1
+            await self.send_cached_stats_image(update, caption, self.get_main_keyboard())
+            return
+        
+        user_id = update.effective_user.id if update.effective_user else update.effective_chat.id
+        now = time.monotonic()
+        
+        if now - self._stats_cooldown.get(user_id, -STATS_COOLDOWN_SECONDS) < STATS_COOLDOWN_SECONDS:
+            self.stats_counters['shed_cooldown'] += 1
+            await self.send_stats_fallback(update, stats, caption, reply_markup)
+            return
+        
+        if not self.reserve_render():
+            self.stats_counters['shed_budget'] += 1
+            await self.send_stats_fallback(update, stats, caption, reply_markup)
+            return
+        
+        if len(self._stats_cooldown) > 10000:
+            self._stats_cooldown = {
+                uid: t for uid, t in self._stats_cooldown.items()
+                if now - t < STATS_COOLDOWN_SECONDS
+            }
+        self._stats_cooldown[user_id] = now
+        
+        try:
+            await self.reply_text(update, "🎨 Генерую статистику...", reply_markup=reply_markup)
+            image_buf = await asyncio.to_thread(self.generate_stats_image)
+        finally:
+            self.release_render()
+        
+        if not image_buf:
+            await self.reply_text(update, "❌ Статистики поки немає", reply_markup=reply_markup)
+            return
+        
+        self.stats_counters['rendered'] += 1
+        self._stats_image = (key, None, image_buf.getvalue())
+        await self.send_cached_stats_image(update, caption, self.get_main_keyboard())
+    
+    async def send_stats_fallback(self, update, stats, caption, reply_markup):
+        if self._stats_image:
+            self.stats_counters['degraded_image'] += 1
+            await self.send_cached_stats_image(update, caption + "\n(остання збережена версія)", self.get_main_keyboard())
         else:
-            await update.message.reply_text("❌ Статистики поки немає")
+            self.stats_counters['degraded_text'] += 1
+            await self.reply_text(update, self.format_stats_summary(stats), parse_mode='HTML', reply_markup=reply_markup)
     
     async def timer_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        message = self.format_timer_message()
-        await update.message.reply_text(message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
+        message = await asyncio.to_thread(self.format_timer_message)
+        await self.reply_text(update, message, parse_mode='HTML', reply_markup=self.get_main_keyboard())
+    
+    def build_inline_results(self):
+        """Всі варіанти inline-відповіді для групи на поточну хвилину"""
+        now = self.get_kyiv_time()
+        tomorrow_str = (now + timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        def article(view, title, description, text):
+            return InlineQueryResultArticle(
+                id=f"3.1:{view}:{now.strftime('%Y%m%d%H%M')}:{self.index.version}",
+                title=title,
+                description=description,
+                input_message_content=InputTextMessageContent(text, parse_mode='HTML', disable_web_page_preview=True)
+            )
+        
+        current = self.get_current_status()
+        if current['status'] is None:
+            now_description = "Графік відсутній"
+        elif current['status']:
+            now_description = f"🟢 Є світло до {current['end_time']}"
+        else:
+            now_description = f"🔴 Відключення до {current['end_time']}"
+        
+        results = {
+            'now': [article('now', f"⚡ Зараз ({now.strftime('%H:%M')})", now_description, self.format_now_message())],
+            'today': [article(
+                'today', "📅 Графік на сьогодні", "Повний графік - Група 3.1",
+                self.format_schedule_message(self.get_full_schedule())
+            )],
+        }
+        
+        if self.index.periods(tomorrow_str):
+            text = self.render_day_block(tomorrow_str) + "\n📍 Група: 3.1"
+            results['tomorrow'] = [article('tomorrow', "📆 Графік на завтра", "Група 3.1", text)]
+        else:
+            results['tomorrow'] = []
+        
+        results['all'] = results['now'] + results['today'] + results['tomorrow']
+        return {'3.1': results}
+    
+    def get_inline_results(self, query_text):
+        """Пошук - лише вибірка зі словника; перебудова раз на хвилину/версію графіка"""
+        now = self.get_kyiv_time()
+        key = (self.index.version, now.strftime('%Y-%m-%d %H:%M'))
+        if key != self._inline_key:
+            self._inline_results = self.build_inline_results()
+            self._inline_key = key
+        
+        words = query_text.lower().split()
+        group = '3.1'
+        view = 'all'
+        for word in words:
+            if word in self._inline_results:
+                group = word
+            elif word in INLINE_ALIASES:
+                view = INLINE_ALIASES[word]
+            else:
+                return [], max(1, 60 - now.second)
+        
+        # Telegram кешує відповідь до кінця хвилини - далі текст вже застаріє
+        return self._inline_results[group][view], max(1, 60 - now.second)
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.inline_query
+        results, cache_time = self.get_inline_results(query.query)
+        # Не через диспетчер: answerInlineQuery - не повідомлення в чат, ліміт чату
+        # (1/с) тут лише затримував би відповіді на кожну натиснуту літеру
+        await query.answer(results, cache_time=cache_time, is_personal=False)
+    
+    async def reply_text(self, update, text, lane=LANE_INTERACTIVE, **kwargs):
+        return await self.outbound.send(lane, update.effective_chat.id, update.message.reply_text, text, **kwargs)
+    
+    async def reply_photo(self, update, photo, lane=LANE_INTERACTIVE, **kwargs):
+        return await self.outbound.send(lane, update.effective_chat.id, update.message.reply_photo, photo, **kwargs)
+    
+    async def send_message(self, application, chat_id, text, lane=LANE_BROADCAST, **kwargs):
+        return await self.outbound.send(
+            lane, chat_id, application.bot.send_message, chat_id=chat_id, text=text, **kwargs
+        )
+    
+    def get_metrics(self):
+        return {
+            'outbound': self.outbound.snapshot(),
+            'stats_image': dict(self.stats_counters, renders_in_flight=self._renders_in_flight),
+            'sources': self.source_poller.snapshot() if self.source_poller else {},
+            'images': dict(self.image_metrics, encode_ms=round(self.image_metrics['encode_ms'], 1)),
+            'users': self.users.snapshot()
+        }
+    
+    def apply_source_results(self, results):
+        """Нормалізовані результати -> region_schedules; основна група -> self.schedules.
+        Інші групи поки лише збираються (видно в /metrics через джерела), не віддаються."""
+        region_schedules = {}
+        for region, groups in results.items():
+            for group, days in groups.items():
+                region_schedules[f"{region}:{group}"] = days
+        self.region_schedules = region_schedules
+        
+        changed = []
+        for date_str, schedule in sorted(region_schedules.get(SOURCE_PRIMARY, {}).items()):
+            if self.set_day_schedule(date_str, schedule, sync=False):
+                changed.append(date_str)
+        
+        if changed:
+            self.auto_sync_stats(changed=changed, removed=[])
+            self.publish_snapshot()
+            logger.info(f"🔔 ГРАФІК ЗМІНИВСЯ (джерело): {', '.join(changed)}")
+            self.save_old_schedules()
+            self._write_json('pending_broadcast.json', {'digest': ScheduleIndex.digest_all(self.schedules)})
+        
+        return changed
+    
+    async def source_loop(self):
+        while True:
+            try:
+                results = await self.source_poller.poll_all()
+                self.apply_source_results(results)
+            except Exception as e:
+                logger.error(f"❌ Джерела: {e}")
+            
+            await asyncio.sleep(SOURCE_POLL_SECONDS)
+    
+    def get_shard(self, update):
+        chat = update.effective_chat
+        if chat is None:
+            return self.worker_index
+        return chat.id % WORKER_COUNT
+    
+    async def route_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Апдейти чатів (і свої теж) кладемо в inbox шарду - обробляє той,
+        хто тримає оренду шарду, у порядку inbox. Без чату - обробляємо одразу."""
+        if update.update_id in self._from_inbox:
+            self._from_inbox.discard(update.update_id)
+            return
+        if update.effective_chat is None:
+            return
+        
+        await asyncio.to_thread(self.storage.enqueue_update, self.get_shard(update), json.dumps(update.to_dict()))
+        raise ApplicationHandlerStop
+    
+    def refresh_shards(self):
+        """Продовжує оренди: пульс воркера, свій шард, шарди мертвих воркерів.
+        Підхоплений шард повертаємо, щойно його воркер знову живий."""
+        self.storage.try_acquire_lease(f'worker:{self.worker_index}', self.worker_id, SHARD_LEASE_SECONDS)
+        
+        owned = set()
+        for shard in range(WORKER_COUNT):
+            name = f'shard:{shard}'
+            if shard != self.worker_index and self.storage.lease_alive(f'worker:{shard}'):
+                self.storage.release_lease(name, self.worker_id)
+                continue
+            if self.storage.try_acquire_lease(name, self.worker_id, SHARD_LEASE_SECONDS):
+                owned.add(shard)
+        
+        if owned != self.owned_shards:
+            logger.info(f"🧩 Шарди: {sorted(owned)} ({self.worker_id})")
+        self.owned_shards = owned
+    
+    async def shard_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh_shards)
+            except Exception as e:
+                logger.error(f"❌ Шарди: {e}")
+                self.owned_shards = set()
+            
+            await asyncio.sleep(SHARD_LEASE_SECONDS / 3)
+    
+    def claim_inbox_updates(self, shard, bot):
+        """Партія апдейтів шарду, впорядкована за update_id (воркери пишуть
+        в inbox паралельно; порядок гарантовано в межах партії)"""
+        payloads = self.storage.claim_updates(shard)
+        updates = [Update.de_json(json.loads(payload), bot) for payload in payloads]
+        updates.sort(key=lambda update: update.update_id)
+        return updates
+    
+    async def inbox_loop(self, application: Application):
+        """Забирає апдейти з inbox усіх шардів, які ми орендуємо"""
+        while True:
+            fed = 0
+            try:
+                for shard in sorted(self.owned_shards):
+                    updates = await asyncio.to_thread(self.claim_inbox_updates, shard, application.bot)
+                    for update in updates:
+                        self._from_inbox.add(update.update_id)
+                        await application.update_queue.put(update)
+                    fed += len(updates)
+            except Exception as e:
+                logger.error(f"❌ Inbox: {e}")
+            
+            if not fed:
+                await asyncio.sleep(INBOX_POLL_SECONDS)
+    
+    def collect_due_alerts(self):
+        """Наступна зміна статусу, якщо до неї <= alert_lead_minutes"""
+        if self.alert_lead_minutes <= 0:
+            return []
+        
+        next_period = self.get_next_period()
+        if not next_period:
+            return []
+        
+        # Межа днів без зміни статусу (22:00-00:00 і 00:00-02:00 - одне відключення)
+        if next_period['status'] == self.get_current_status()['status']:
+            return []
+        
+        now = self.get_kyiv_time()
+        if next_period['start_datetime'] - now > timedelta(minutes=self.alert_lead_minutes):
+            return []
+        
+        if next_period['status']:
+            text = f"🟢 О <b>{next_period['start_time']}</b> ввімкнуть світло\n📍 Група: 3.1"
+        else:
+            text = f"🔴 О <b>{next_period['start_time']}</b> відключення!\n📍 Група: 3.1"
+        
+        return [(next_period['start_datetime'].isoformat(), text)]
+    
+    async def send_due_alerts(self, application: Application):
+        group_chat_id = await asyncio.to_thread(self.load_group_chat_id)
+        if not group_chat_id:
+            return
+        
+        sent = await asyncio.to_thread(self._read_json, 'alerts_sent.json', {})
+        for key, text in self.collect_due_alerts():
+            if key in sent:
+                continue
+            try:
+                await self.send_message(application, group_chat_id, text, parse_mode='HTML')
+                logger.info(f"⏰ Сповіщення: {key}")
+            except Exception as e:
+                logger.error(f"❌ ПОМИЛКА: {e}")
+            sent = {key: True}
+            await asyncio.to_thread(self._write_json, 'alerts_sent.json', sent)
+    
+    async def send_pending_broadcast(self, application: Application):
+        pending = await asyncio.to_thread(self._read_json, 'pending_broadcast.json', {})
+        sent = await asyncio.to_thread(self._read_json, 'broadcast_sent.json', {})
+        
+        if not pending.get('digest') or pending.get('digest') == sent.get('digest'):
+            return
+        
+        logger.info("🔔 НАДСИЛАЮ В ГРУПУ...")
+        # Як і раніше - одна спроба на кожну зміну графіка
+        await asyncio.to_thread(self._write_json, 'broadcast_sent.json', {'digest': pending['digest']})
+        await self.send_schedule_to_group(application, test_mode=False)
+    
+    async def leader_loop(self, application: Application):
+        """Оренда лідера: розсилки й сповіщення шле лише один воркер"""
+        while True:
+            try:
+                was_leader = self.is_leader
+                self.is_leader = await asyncio.to_thread(
+                    self.storage.try_acquire_lease, 'leader', self.worker_id, LEADER_LEASE_SECONDS
+                )
+                if self.is_leader != was_leader:
+                    logger.info(f"👑 Лідер: {self.is_leader} ({self.worker_id})")
+                
+                if self.is_leader:
+                    await self.send_pending_broadcast(application)
+                    await self.send_due_alerts(application)
+            except Exception as e:
+                logger.error(f"❌ Лідер: {e}")
+            
+            await asyncio.sleep(min(LEADER_LEASE_SECONDS / 3, 30))
     
     async def post_init(self, application: Application):
         """Викликається після запуску"""
         logger.info("🔄 post_init")
         
-        if self.schedule_changed:
-            logger.info("🔔 НАДСИЛАЮ В ГРУПУ...")
-            await self.send_schedule_to_group(application, test_mode=False)
-        else:
+        if not self.schedule_changed:
             logger.info("ℹ️ Без змін")
+        
+        await self.outbound.start()
+        
+        self._background_tasks = [
+            asyncio.create_task(self.leader_loop(application)),
+        ]
+        if WORKER_COUNT > 1:
+            self._background_tasks.append(asyncio.create_task(self.shard_loop()))
+            self._background_tasks.append(asyncio.create_task(self.inbox_loop(application)))
+        
+        adapters = load_source_adapters()
+        if adapters:
+            self.source_poller = SourcePoller(adapters)
+            self._background_tasks.append(asyncio.create_task(self.source_loop()))
+            logger.info(f"🛰️ Джерел: {len(adapters)}")
+        
+        if HTTP_API_PORT:
+            self.api_server = ScheduleApiServer(self)
+            await self.api_server.start()
+    
+    async def post_shutdown(self, application: Application):
+        for task in self._background_tasks:
+            task.cancel()
+        
+        await self.outbound.stop()
+        
+        if self.api_server:
+            await self.api_server.stop()
     
     def run(self):
         now = self.get_kyiv_time()
@@ -993,25 +3415,194 @@ class PowerScheduleBot:
         logger.info(f"🚀 ЗАПУСК: {now.strftime('%d.%m.%Y %H:%M:%S')}")
         logger.info(f"📅 Графіків: {len(self.schedules)}")
         logger.info(f"🔄 Змінився: {self.schedule_changed}")
+        logger.info(f"🧵 Паралельних апдейтів: {MAX_CONCURRENT_UPDATES}")
+        logger.info(f"🗄️ Сховище: {STORAGE_BACKEND} | Воркер {WORKER_INDEX + 1}/{WORKER_COUNT}")
+        
+        if WORKER_COUNT > 1 and (not self.storage.shared or not WEBHOOK_URL):
+            logger.error("❌ Для кількох воркерів потрібні STORAGE_BACKEND=sqlite і WEBHOOK_URL")
+            return
         logger.info("=" * 60)
         
-        application = Application.builder().token(self.bot_token).build()
+        application = (
+            Application.builder()
+            .token(self.bot_token)
+            .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+            .connection_pool_size(CONNECTION_POOL_SIZE)
+            .pool_timeout(10)
+            .build()
+        )
+        
+        if WORKER_COUNT > 1:
+            application.add_handler(TypeHandler(Update, self.route_update), group=-1)
         
         application.add_handler(CommandHandler("start", self.start_command))
         application.add_handler(CommandHandler("schedule", self.schedule_command))
         application.add_handler(CommandHandler("now", self.now_command))
         application.add_handler(CommandHandler("stats", self.stats_command))
         application.add_handler(CommandHandler("timer", self.timer_command))
+        application.add_handler(CommandHandler("heatmap", self.heatmap_command))
+        application.add_handler(CommandHandler("window", self.window_command))
         application.add_handler(CommandHandler("testnotify", self.test_notify_command))
+        application.add_handler(CallbackQueryHandler(self.schedule_page_callback, pattern=r'^sched:'))
+        application.add_handler(InlineQueryHandler(self.inline_query))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         
         application.post_init = self.post_init
+        application.post_shutdown = self.post_shutdown
         
         logger.info("✅ БОТ ЗАПУЩЕНО")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if WEBHOOK_URL:
+            application.run_webhook(
+                listen='0.0.0.0',
+                port=WEBHOOK_PORT,
+                webhook_url=WEBHOOK_URL,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+
+class SimulatedClock:
+    """Керований годинник: час іде лише через advance()"""
+    
+    def __init__(self, start):
+        self.now = start
+    
+    def __call__(self):
+        return self.now
+    
+    def advance(self, minutes=1):
+        self.now += timedelta(minutes=minutes)
+
+
+class ScheduleSimulator:
+    """Прокручує графіки хвилина за хвилиною через статус, форматування і сповіщення.
+    
+    Кожен виклик записується з результатом і вартістю (мкс); digest по всіх
+    результатах дозволяє порівнювати поведінку між версіями коду.
+    """
+    
+    PATHS = ('now', 'timer', 'real_power_on', 'schedule', 'alerts')
+    
+    def __init__(self, schedules, start, alert_lead_minutes=15, out=None):
+        self.clock = SimulatedClock(start)
+        self.bot = PowerScheduleBot(None, clock=self.clock, schedules=schedules, storage=MemoryStorage())
+        self.bot.alert_lead_minutes = alert_lead_minutes
+        self.out = out
+        self.digest = hashlib.sha1()
+        self.costs = {path: {'calls': 0, 'total_us': 0.0, 'max_us': 0.0, 'errors': 0} for path in self.PATHS}
+        self.alerts = []
+        self._sent_alerts = set()
+    
+    def _call(self, path, func):
+        started = time.perf_counter()
+        try:
+            result = func()
+            error = None
+        except Exception as e:
+            result = None
+            error = f"{type(e).__name__}: {e}"
+        cost = (time.perf_counter() - started) * 1e6
+        
+        if isinstance(result, datetime):
+            result = result.isoformat()
+        
+        stats = self.costs[path]
+        stats['calls'] += 1
+        stats['total_us'] += cost
+        stats['max_us'] = max(stats['max_us'], cost)
+        if error:
+            stats['errors'] += 1
+        
+        record = {'t': self.clock.now.isoformat(), 'path': path, 'cost_us': round(cost, 1), 'output': result}
+        if error:
+            record['error'] = error
+        
+        line = json.dumps(record, ensure_ascii=False, sort_keys=True)
+        # Вартість не входить у digest - лише поведінка
+        self.digest.update(json.dumps([record['t'], path, result, error], ensure_ascii=False).encode('utf-8'))
+        if self.out:
+            self.out.write(line + "\n")
+        
+        return result
+    
+    def step(self):
+        bot = self.bot
+        self._call('now', bot.format_now_message)
+        self._call('timer', bot.format_timer_message)
+        self._call('real_power_on', bot.get_real_power_on_time)
+        self._call('schedule', lambda: bot.format_schedule_message(bot.get_full_schedule()))
+        
+        alerts = self._call('alerts', bot.collect_due_alerts) or []
+        for key, text in alerts:
+            if key not in self._sent_alerts:
+                self._sent_alerts.add(key)
+                self.alerts.append({'t': self.clock.now.isoformat(), 'key': key, 'text': text})
+    
+    def run(self, minutes, step_minutes=1):
+        started = time.perf_counter()
+        steps = 0
+        for _ in range(0, minutes, step_minutes):
+            self.step()
+            self.clock.advance(step_minutes)
+            steps += 1
+        elapsed = time.perf_counter() - started
+        
+        return {
+            'steps': steps,
+            'simulated_minutes': steps * step_minutes,
+            'wall_seconds': round(elapsed, 3),
+            'minutes_per_second': round(steps * step_minutes / elapsed) if elapsed else None,
+            'digest': self.digest.hexdigest(),
+            'alerts': self.alerts,
+            'costs': {
+                path: dict(stats, total_us=round(stats['total_us']), max_us=round(stats['max_us'], 1),
+                           avg_us=round(stats['total_us'] / stats['calls'], 1) if stats['calls'] else 0.0)
+                for path, stats in self.costs.items()
+            },
+        }
+
+
+def simulate(argv):
+    """python telegram_bot.py simulate schedules.json --from 2026-02-14 --days 14"""
+    parser = argparse.ArgumentParser(prog='telegram_bot.py simulate')
+    parser.add_argument('schedules', help="JSON {дата: [[год, хв, світло], ...]} (як old_schedules.json)")
+    parser.add_argument('--from', dest='start', help="Початок симуляції, YYYY-MM-DD (за замовчуванням - перший день)")
+    parser.add_argument('--days', type=int, default=None, help="Скільки днів (за замовчуванням - до кінця графіків)")
+    parser.add_argument('--step', type=int, default=1, help="Крок у хвилинах")
+    parser.add_argument('--alert-lead', type=int, default=15, help="За скільки хвилин сповіщення")
+    parser.add_argument('--out', help="Куди писати всі результати (JSONL)")
+    args = parser.parse_args(argv)
+    
+    with open(args.schedules, 'r', encoding='utf-8') as f:
+        schedules = json.load(f)
+    
+    dates = sorted(schedules)
+    start_str = args.start or dates[0]
+    start = datetime.strptime(start_str, '%Y-%m-%d').replace(tzinfo=KYIV_TZ)
+    if args.days is None:
+        end = datetime.strptime(dates[-1], '%Y-%m-%d').replace(tzinfo=KYIV_TZ) + timedelta(days=1)
+        minutes = max(0, int((end - start).total_seconds() // 60))
+    else:
+        minutes = args.days * 24 * 60
+    
+    logging.getLogger().setLevel(logging.WARNING)
+    out = open(args.out, 'w', encoding='utf-8') if args.out else None
+    try:
+        simulator = ScheduleSimulator(schedules, start, alert_lead_minutes=args.alert_lead, out=out)
+        report = simulator.run(minutes, step_minutes=args.step)
+    finally:
+        if out:
+            out.close()
+    
+    print(json.dumps(report, ensure_ascii=False, indent=2))
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'simulate':
+        simulate(sys.argv[2:])
+        return
+    
     bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
     
     if not bot_token:
@@ -0,0 +1,20 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telegram_bot as tb  # noqa: E402
+
+
+@pytest.fixture
+def bot():
+    """Бот без мережі: пам'ятне сховище, фіксований годинник"""
+    clock = tb.SimulatedClock(datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ))
+    schedules = {
+        '2026-02-14': [(0, 0, True), (6, 30, False), (9, 30, True)],
+        '2026-02-15': [(0, 0, True), (12, 0, False), (15, 0, True)],
+    }
+    return tb.PowerScheduleBot(None, clock=clock, schedules=schedules, storage=tb.MemoryStorage())
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import telegram_bot as tb
+
+
+def make_bot(now):
+    schedules = {
+        '2026-02-14': [(0, 0, True), (22, 0, False)],
+        '2026-02-15': [(0, 0, False), (2, 0, True)],
+    }
+    bot = tb.PowerScheduleBot(None, clock=tb.SimulatedClock(now), schedules=schedules, storage=tb.MemoryStorage())
+    bot.alert_lead_minutes = 15
+    return bot
+
+
+def test_alert_before_status_change():
+    bot = make_bot(datetime(2026, 2, 14, 21, 50, tzinfo=tb.KYIV_TZ))
+    
+    alerts = bot.collect_due_alerts()
+    
+    assert [key for key, _ in alerts] == ['2026-02-14T22:00:00+02:00']
+    assert 'відключення' in alerts[0][1]
+
+
+def test_no_alert_at_midnight_inside_an_outage():
+    bot = make_bot(datetime(2026, 2, 14, 23, 50, tzinfo=tb.KYIV_TZ))
+    
+    assert bot.collect_due_alerts() == []
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import telegram_bot as tb
+
+SCHEDULES = {
+    '2026-02-14': [(0, 0, True), (6, 30, False), (9, 30, True)],
+    '2026-02-15': [(0, 0, True), (22, 0, False)],
+    '2026-02-16': [(0, 0, False), (2, 0, True)],
+}
+
+
+def make_bot(storage, now):
+    clock = tb.SimulatedClock(now)
+    return tb.PowerScheduleBot(None, clock=clock, schedules=dict(SCHEDULES), storage=storage)
+
+
+def test_range_cache_is_normalized_and_bounded(bot, monkeypatch):
+    api = tb.ScheduleApiServer(bot)
+    
+    for day in range(1000):
+        to_str = (datetime(2026, 2, 15) + timedelta(days=day)).strftime('%Y-%m-%d')
+        status, _, _ = api.handle_request('GET', f'/api/3.1/range?from=2026-02-14&to={to_str}', {})
+        assert status == 200
+    
+    # Усі запити впираються в останній наявний день - одна відповідь
+    assert len(api._cache) == 1
+    
+    monkeypatch.setattr(tb, 'API_CACHE_SIZE', 4)
+    for day in range(10):
+        from_str = (datetime(2026, 2, 1) + timedelta(days=day)).strftime('%Y-%m-%d')
+        api.handle_request('GET', f'/api/3.1/range?from={from_str}&to=2026-02-14', {})
+        api.handle_request('GET', f'/api/3.1/range?from={from_str}&to=2026-02-15', {})
+    assert len(api._cache) <= 4
+
+
+def test_range_bad_dates_and_unknown_paths(bot):
+    api = tb.ScheduleApiServer(bot)
+    
+    assert api.handle_request('GET', '/api/3.1/range?from=nope', {})[0] == 400
+    assert api.handle_request('GET', '/api/9.9/today', {})[0] == 404
+    assert api.handle_request('POST', '/api/3.1/today', {})[0] == 405
+
+
+def test_etag_revalidation(bot):
+    api = tb.ScheduleApiServer(bot)
+    
+    status, headers, body = api.handle_request('GET', '/api/3.1/today', {})
+    assert status == 200 and body
+    status, _, body = api.handle_request('GET', '/api/3.1/today', {'if-none-match': headers['ETag']})
+    assert status == 304 and body == b''
+
+
+def test_calendar_etag_survives_restart():
+    storage = tb.MemoryStorage()
+    start = datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ)
+    
+    first = tb.ScheduleApiServer(make_bot(storage, start)).handle_request('GET', '/api/3.1/calendar.ics', {})
+    restarted = make_bot(storage, start + timedelta(hours=3))
+    second = tb.ScheduleApiServer(restarted).handle_request('GET', '/api/3.1/calendar.ics', {})
+    
+    assert first[1]['ETag'] == second[1]['ETag']
+    # Вікно через північ злилось в одну подію
+    assert second[2].count(b'BEGIN:VEVENT') == 2
+
+
+def test_api_binds_to_localhost_by_default(bot):
+    assert tb.ScheduleApiServer(bot).host == '127.0.0.1'
+
+
+def test_slow_headers_are_cut_off(bot, monkeypatch):
+    import asyncio
+    
+    monkeypatch.setattr(tb.ScheduleApiServer, 'KEEPALIVE_TIMEOUT', 0.2)
+    
+    async def run():
+        api = tb.ScheduleApiServer(bot, host='127.0.0.1', port=0)
+        await api.start()
+        port = api.server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /api/3.1/today HTTP/1.1\r\nHost: x\r\n")
+            await writer.drain()
+            # Заголовки не дописуємо - сервер має закрити з'єднання сам
+            closed = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+            
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /api/3.1/today HTTP/1.1\r\n" + b"X-A: b\r\n" * 100 + b"\r\n")
+            await writer.drain()
+            flooded = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+            
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /api/3.1/today HTTP/1.1\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            ok = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+            return closed, flooded, ok
+        finally:
+            await api.stop()
+    
+    closed, flooded, ok = asyncio.run(run())
+    
+    assert closed == b'' and flooded == b''
+    assert ok.startswith(b'HTTP/1.1 200 OK')
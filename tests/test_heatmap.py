@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import numpy as np
+
+import telegram_bot as tb
+
+
+def test_archive_drops_days_past_retention(bot, monkeypatch):
+    monkeypatch.setattr(tb, 'ARCHIVE_DAYS', 30)
+    bot.storage.save_records(tb.STATUS_ARCHIVE, {'2025-01-01': '0' * 48, '2026-02-01': '1' * 48})
+    
+    bot.set_day_schedule('2026-02-16', [(0, 0, False), (12, 0, True)])
+    
+    archive = bot.storage.load_records(tb.STATUS_ARCHIVE)
+    assert '2025-01-01' not in archive
+    assert archive['2026-02-01'] == '1' * 48
+    assert archive['2026-02-16'] == '0' * 24 + '1' * 24
+
+
+def test_heatmap_probability_by_weekday(bot):
+    # 2026-02-14 - субота, 2026-02-21 - наступна субота
+    archive = {'2026-02-14': '0' * 48, '2026-02-21': '0' * 24 + '1' * 24}
+    probability, day_counts = bot.compute_heatmap(archive)
+    
+    saturday = datetime(2026, 2, 14).weekday()
+    assert day_counts[saturday] == 2
+    assert probability[saturday, 0] == 1.0
+    assert probability[saturday, 47] == 0.5
+    assert np.isnan(probability[0, 0])
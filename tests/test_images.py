@@ -0,0 +1,28 @@
+from PIL import Image
+
+import telegram_bot as tb
+
+
+def test_stats_image_is_encoded_from_raw_raster(bot, monkeypatch):
+    monkeypatch.setattr(tb, 'STATS_IMAGE_FORMAT', 'png')
+    
+    buf = bot.generate_stats_image()
+    img = Image.open(buf)
+    
+    assert buf.name == 'stats.png'
+    assert img.mode == 'P'
+    last = bot.image_metrics['last']
+    # Сирий RGBA = ширина * висота * 4: без проміжного PNG
+    assert last['raw_bytes'] == img.size[0] * img.size[1] * 4
+    assert last['encode_ms'] > 0
+    assert last['bytes'] < last['raw_bytes']
+
+
+def test_heatmap_image_webp(bot, monkeypatch):
+    monkeypatch.setattr(tb, 'STATS_IMAGE_FORMAT', 'webp')
+    
+    buf = bot.generate_heatmap_image()
+    
+    assert buf.name == 'heatmap.webp'
+    assert Image.open(buf).format == 'WEBP'
+    assert bot.image_metrics['images'] == 1
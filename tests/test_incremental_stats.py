@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import telegram_bot as tb
+
+
+def make_schedules(days):
+    start = datetime(2026, 2, 13)
+    return {
+        (start + timedelta(days=i)).strftime('%Y-%m-%d'): [(0, 0, True), (i % 24, 0, False), (i % 24, 30, True)]
+        for i in range(days)
+    }
+
+
+def test_sqlite_writes_only_changed_rows(tmp_path):
+    storage = tb.SqliteStorage(str(tmp_path / 'state.db'))
+    clock = tb.SimulatedClock(datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ))
+    bot = tb.PowerScheduleBot(None, clock=clock, schedules=make_schedules(40), storage=storage)
+    
+    assert len(bot.index.dates) == 40
+    
+    before = storage._conn.total_changes
+    bot.set_day_schedule('2026-02-20', [(0, 0, False), (12, 0, True)])
+    
+    # Один рядок статистики + один рядок архіву - незалежно від кількості днів
+    assert storage._conn.total_changes - before == 2
+    assert bot.load_stats()['2026-02-20']['hours_without_power'] == 12.0
+
+
+def test_unchanged_days_are_not_recomputed(bot, monkeypatch):
+    computed = []
+    compute = bot.compute_day_stats
+    monkeypatch.setattr(bot, 'compute_day_stats', lambda d: computed.append(d) or compute(d))
+    
+    assert not bot.set_day_schedule('2026-02-14', [(0, 0, True), (6, 30, False), (9, 30, True)])
+    bot.set_day_schedule('2026-02-15', [(0, 0, False)])
+    
+    assert computed == ['2026-02-15']
+
+
+def test_index_updates_swap_instead_of_mutating(bot):
+    dates, days = bot.index.dates, bot.index.days
+    
+    bot.set_day_schedule('2026-02-16', [(0, 0, True)])
+    bot.set_day_schedule('2026-02-14', None)
+    
+    assert dates == ['2026-02-14', '2026-02-15'] and '2026-02-16' not in days
+    assert bot.index.dates == ['2026-02-15', '2026-02-16']
+
+
+def test_archive_prune_does_not_read_the_archive(tmp_path, monkeypatch):
+    storage = tb.SqliteStorage(str(tmp_path / 'state.db'))
+    clock = tb.SimulatedClock(datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ))
+    bot = tb.PowerScheduleBot(None, clock=clock, schedules=make_schedules(40), storage=storage)
+    storage.save_records(tb.STATUS_ARCHIVE, {'2024-01-01': '0' * 48})
+    
+    reads = []
+    monkeypatch.setattr(storage, 'load_records', lambda name: reads.append(name) or {})
+    bot.set_day_schedule('2026-02-20', [(0, 0, False), (12, 0, True)])
+    
+    assert tb.STATUS_ARCHIVE not in reads
+    assert storage.load_record(tb.STATUS_ARCHIVE, '2024-01-01') is None
+    assert storage.load_record(tb.STATUS_ARCHIVE, '2026-02-20') == '0' * 24 + '1' * 24
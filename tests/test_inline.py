@@ -0,0 +1,34 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import telegram_bot as tb
+
+
+def test_inline_answers_skip_per_chat_throttle(bot):
+    answered = []
+    
+    async def run():
+        await bot.outbound.start()
+        try:
+            started = time.monotonic()
+            for text in ('n', 'no', 'now', 'now ', 'now 3', 'tomorrow'):
+                async def answer(results, **kwargs):
+                    answered.append((time.monotonic() - started, results))
+                query = SimpleNamespace(query=text, from_user=SimpleNamespace(id=42), answer=answer)
+                await bot.inline_query(SimpleNamespace(inline_query=query), None)
+        finally:
+            await bot.outbound.stop()
+    
+    asyncio.run(run())
+    
+    assert len(answered) == 6
+    assert answered[-1][0] < 0.5
+
+
+def test_inline_results_are_precomputed_per_minute(bot):
+    first, cache_time = bot.get_inline_results('now')
+    second, _ = bot.get_inline_results('NOW')
+    
+    assert first and first is second
+    assert cache_time > 0
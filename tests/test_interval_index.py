@@ -0,0 +1,88 @@
+import random
+from datetime import datetime, timedelta
+
+import telegram_bot as tb
+
+
+def build(schedules):
+    index = tb.ScheduleIndex()
+    index.rebuild(schedules)
+    return tb.IntervalIndex(index)
+
+
+def random_schedules(rng, days):
+    start = datetime(2026, 2, 14)
+    schedules = {}
+    for d in range(days):
+        slots = sorted(rng.sample(range(1, 48), rng.randint(0, 8)))
+        schedule = [(0, 0, rng.random() < 0.5)]
+        for slot in slots:
+            schedule.append((slot // 2, (slot % 2) * 30, not schedule[-1][2]))
+        schedules[(start + timedelta(days=d)).strftime('%Y-%m-%d')] = schedule
+    return schedules
+
+
+def brute_intervals(schedules):
+    """Злиті інтервали простим перебором по хвилинах"""
+    minutes = []
+    for date_str in sorted(schedules):
+        day = datetime.strptime(date_str, '%Y-%m-%d').toordinal() * 1440
+        for start, end, status in tb.ScheduleIndex.compile_day(schedules[date_str]):
+            minutes.extend((day + m, status) for m in range(start, end))
+    
+    intervals = []
+    for minute, status in minutes:
+        if intervals and intervals[-1][1] == minute and intervals[-1][2] == status:
+            intervals[-1][1] = minute + 1
+        else:
+            intervals.append([minute, minute + 1, status])
+    return intervals
+
+
+def test_outage_across_midnight_is_one_window():
+    index = build({
+        '2026-02-14': [(0, 0, True), (22, 0, False)],
+        '2026-02-15': [(0, 0, False), (2, 0, True)],
+    })
+    day = datetime(2026, 2, 14).toordinal() * 1440
+    
+    assert index.find(False, 240, day) == [(day + 22 * 60, day + 26 * 60)]
+    # Вже триває - рахується лише залишок
+    assert index.find(False, 60, day + 23 * 60) == [(day + 23 * 60, day + 26 * 60)]
+    assert index.find(False, 181, day + 23 * 60) == []
+    assert index.longest(True, day + 12 * 60, day + 2 * 1440) == (day + 26 * 60, day + 2 * 1440)
+
+
+def test_find_and_longest_match_brute_force():
+    rng = random.Random(7)
+    for _ in range(30):
+        schedules = random_schedules(rng, rng.randint(1, 6))
+        index = build(schedules)
+        intervals = brute_intervals(schedules)
+        first, last = intervals[0][0], intervals[-1][1]
+        
+        for _ in range(20):
+            status = rng.random() < 0.5
+            duration = rng.choice([1, 30, 60, 120, 300])
+            after = rng.randint(first, last)
+            
+            expected = []
+            for start, end, st in intervals:
+                if st != status or end <= after:
+                    continue
+                start = max(start, after)
+                if end - start >= duration:
+                    expected.append((start, end))
+            assert index.find(status, duration, after, limit=3) == expected[:3]
+            
+            window_end = rng.randint(after, last)
+            clipped = [
+                (max(s, after), min(e, window_end)) for s, e, st in intervals
+                if st == status and s < window_end and e > after
+            ]
+            best = max(clipped, key=lambda w: w[1] - w[0], default=None)
+            found = index.longest(status, after, window_end)
+            if best is None:
+                assert found is None
+            else:
+                assert found[1] - found[0] == best[1] - best[0]
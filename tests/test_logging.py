@@ -0,0 +1,71 @@
+import json
+import logging
+import queue
+
+import telegram_bot as tb
+
+
+def emit(formatter, log_call):
+    log_queue = queue.SimpleQueue()
+    handler = tb.StructuredQueueHandler(log_queue)
+    handler.addFilter(tb.RequestContextFilter())
+    logger = logging.getLogger('test_logging')
+    logger.propagate = False
+    logger.handlers[:] = [handler]
+    try:
+        log_call(logger)
+    finally:
+        logger.handlers[:] = []
+    return formatter.format(log_queue.get_nowait())
+
+
+def test_json_exception_is_a_separate_field():
+    def log_call(logger):
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("❌ помилка %s", 42)
+    
+    entry = json.loads(emit(tb.JsonLogFormatter(), log_call))
+    
+    assert entry['msg'] == "❌ помилка 42"
+    assert entry['exc'].startswith('Traceback')
+    assert 'ZeroDivisionError' in entry['exc']
+
+
+def test_text_format_keeps_traceback():
+    def log_call(logger):
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("❌ помилка")
+    
+    line = emit(logging.Formatter('%(levelname)s - %(message)s'), log_call)
+    
+    assert line.startswith('ERROR - ❌ помилка\nTraceback')
+
+
+def test_request_context_fields():
+    token = tb.request_context.set({'request_id': 'u1', 'chat_id': -5, 'started': 0})
+    try:
+        entry = json.loads(emit(tb.JsonLogFormatter(), lambda logger: logger.warning("⚠️ тест")))
+    finally:
+        tb.request_context.reset(token)
+    
+    assert entry['request_id'] == 'u1' and entry['chat_id'] == -5
+    assert 'elapsed_ms' in entry
+
+
+def test_sampling_filter_keeps_every_nth():
+    sampler = tb.SamplingFilter(prefixes=('📖 ID групи',), every=5)
+    records = [
+        logging.LogRecord('t', logging.INFO, __file__, 0, f"📖 ID групи: {i}", None, None)
+        for i in range(10)
+    ]
+    passed = [r for r in records if sampler.filter(r)]
+    
+    assert [r.msg for r in passed] == ["📖 ID групи: 0", "📖 ID групи: 5"]
+    assert all(r.sampled == 5 for r in passed)
+    
+    warning = logging.LogRecord('t', logging.WARNING, __file__, 0, "📖 ID групи: x", None, None)
+    assert sampler.filter(warning)
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import telegram_bot as tb
+
+
+def run_dispatcher(scenario, **kwargs):
+    async def run():
+        dispatcher = tb.OutboundDispatcher(**kwargs)
+        await dispatcher.start()
+        try:
+            return await scenario(dispatcher)
+        finally:
+            await dispatcher.stop()
+    return asyncio.run(run())
+
+
+def test_throttled_group_does_not_block_other_chats():
+    async def scenario(dispatcher):
+        started = time.monotonic()
+        delivered = {}
+        
+        async def send(key):
+            delivered[key] = time.monotonic() - started
+        
+        group = [
+            asyncio.create_task(dispatcher.send(tb.LANE_INTERACTIVE, -100, send, ('group', i)))
+            for i in range(8)
+        ]
+        await asyncio.sleep(0)
+        private = dispatcher.send(tb.LANE_INTERACTIVE, 42, send, ('private', 0))
+        await asyncio.wait_for(private, 1)
+        for task in group:
+            task.cancel()
+        return delivered
+    
+    delivered = run_dispatcher(scenario, workers=4)
+    
+    assert delivered[('private', 0)] < 0.5
+    # Група: лише burst без очікування, решта чекає на токени
+    assert len([k for k in delivered if k[0] == 'group']) == 3
+
+
+def test_chat_order_is_preserved():
+    async def scenario(dispatcher):
+        order = []
+        
+        async def send(i):
+            await asyncio.sleep(0.001 * (3 - i))
+            order.append(i)
+        
+        await asyncio.gather(*(dispatcher.send(tb.LANE_LIVE, 7, send, i) for i in range(3)))
+        return order
+    
+    assert run_dispatcher(scenario, workers=4) == [0, 1, 2]
+
+
+def test_interactive_lane_goes_first():
+    async def scenario(dispatcher):
+        order = []
+        
+        async def send(tag):
+            order.append(tag)
+        
+        tasks = [asyncio.create_task(dispatcher.send(tb.LANE_BROADCAST, 1000 + i, send, 'broadcast')) for i in range(3)]
+        tasks.append(asyncio.create_task(dispatcher.send(tb.LANE_INTERACTIVE, 1, send, 'interactive')))
+        await asyncio.gather(*tasks)
+        return order
+    
+    assert run_dispatcher(scenario, workers=1)[0] == 'interactive'
@@ -0,0 +1,63 @@
+import asyncio
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import telegram_bot as tb
+
+
+def make_update(user_id):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id)
+    )
+
+
+def patch_bot(bot, render_attr):
+    """Заглушки для відправки та рендера; рахує пік одночасних рендерів"""
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+    
+    async def reply(*args, **kwargs):
+        await asyncio.sleep(0.01)
+    
+    def render():
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+        return io.BytesIO(b'png')
+    
+    bot.reply_text = reply
+    bot.reply_photo = reply
+    setattr(bot, render_attr, render)
+    return state
+
+
+def test_stats_renders_stay_within_budget(bot):
+    state = patch_bot(bot, 'generate_stats_image')
+    
+    async def run():
+        await asyncio.gather(*(bot.send_stats(make_update(i)) for i in range(10)))
+    
+    asyncio.run(run())
+    
+    assert state['peak'] <= tb.RENDER_BUDGET
+    assert bot.stats_counters['peak_renders'] <= tb.RENDER_BUDGET
+    assert bot.stats_counters['shed_budget'] == 10 - tb.RENDER_BUDGET
+    assert bot._renders_in_flight == 0
+
+
+def test_heatmap_renders_stay_within_budget(bot):
+    state = patch_bot(bot, 'generate_heatmap_image')
+    
+    async def run():
+        await asyncio.gather(*(bot.heatmap_command(make_update(i), None) for i in range(10)))
+    
+    asyncio.run(run())
+    
+    assert state['peak'] <= tb.RENDER_BUDGET
+    assert bot._renders_in_flight == 0
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import telegram_bot as tb
+
+
+def test_leap_day_without_year(bot):
+    bot.clock = lambda: datetime(2028, 2, 10, 12, 0, tzinfo=tb.KYIV_TZ)
+    
+    assert bot.parse_date_arg('29.02') == '2028-02-29'
+    assert bot.parse_date_arg('29.02.2028') == '2028-02-29'
+    assert bot.parse_date_arg('2028-02-29') == '2028-02-29'
+
+
+def test_leap_day_rejected_in_common_year(bot):
+    assert bot.parse_date_arg('29.02') is None
+    assert bot.parse_date_arg('31.04') is None
+    assert bot.parse_date_arg('14.2x') is None
+
+
+def test_range_across_new_year(bot):
+    bot.clock = lambda: datetime(2026, 12, 20, 12, 0, tzinfo=tb.KYIV_TZ)
+    
+    assert bot.parse_date_range('28.12..03.01') == ('2026-12-28', '2027-01-03')
+    assert bot.parse_date_range('14.12') == ('2026-12-14', '2026-12-14')
+    assert bot.parse_date_range('2026-12-28..2026-12-01') is None
+
+
+def test_range_pages_fit_and_cover_every_day(bot):
+    start = datetime(2026, 2, 16)
+    for i in range(20):
+        date_str = (start + timedelta(days=i)).strftime('%Y-%m-%d')
+        schedule = [(0, 0, True)] + [(h, 30, h % 2 == 0) for h in range(1, 24)]
+        bot.set_day_schedule(date_str, schedule)
+    
+    pages = bot.get_range_pages('2026-02-14', '2026-03-10')
+    
+    assert len(pages) > 1
+    assert all(tb.telegram_len(page) <= tb.TELEGRAM_MESSAGE_LIMIT for page in pages)
+    assert all(page.count('📆') <= tb.RANGE_PAGE_DAYS for page in pages)
+    assert sum(page.count('📆') for page in pages) == 22
+    assert sum(page.count('📍 Група: 3.1') for page in pages) == len(pages)
+    
+    keyboard = bot.get_range_keyboard('2026-02-14', '2026-03-10', 0, len(pages))
+    buttons = keyboard.inline_keyboard[0]
+    assert [b.callback_data for b in buttons] == ['sched:noop', 'sched:2026-02-14:2026-03-10:1']
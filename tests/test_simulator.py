@@ -0,0 +1,38 @@
+import logging
+from datetime import datetime
+
+import telegram_bot as tb
+
+# Відключення 22:00-02:00 через північ і ще одне ввечері наступного дня
+SCHEDULES = {
+    '2026-02-14': [(0, 0, True), (6, 30, False), (9, 30, True), (22, 0, False)],
+    '2026-02-15': [(0, 0, False), (2, 0, True), (18, 0, False), (21, 0, True)],
+}
+
+# Зафіксована поведінка: змінюється лише разом з навмисною зміною виводу
+PINNED_DIGEST = '46ea4a9d58a31318c36b7ff5c483d3cdcc0730a8'
+
+
+def run(**kwargs):
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        simulator = tb.ScheduleSimulator(dict(SCHEDULES), datetime(2026, 2, 14, 20, 0, tzinfo=tb.KYIV_TZ), **kwargs)
+        return simulator.run(8 * 60, step_minutes=5)
+    finally:
+        logging.getLogger().setLevel(tb.LOG_LEVEL)
+
+
+def test_simulation_across_midnight_is_pinned():
+    report = run(alert_lead_minutes=15)
+    
+    assert report['steps'] == 96
+    assert all(cost['errors'] == 0 for cost in report['costs'].values())
+    assert [alert['key'] for alert in report['alerts']] == [
+        '2026-02-14T22:00:00+02:00',
+        '2026-02-15T02:00:00+02:00',
+    ]
+    assert report['digest'] == PINNED_DIGEST
+
+
+def test_simulation_is_deterministic():
+    assert run()['digest'] == run()['digest']
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import telegram_bot as tb
+
+
+def make_bot(storage, schedules):
+    clock = tb.SimulatedClock(datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ))
+    return tb.PowerScheduleBot(None, clock=clock, schedules=schedules, storage=storage)
+
+
+SCHEDULES = {
+    '2026-02-14': [(0, 0, True), (6, 30, False), (9, 30, True)],
+    '2026-02-15': [(0, 0, True)],
+}
+
+
+def test_published_on_startup_without_changes(tmp_path, monkeypatch):
+    storage = tb.MemoryStorage()
+    make_bot(storage, dict(SCHEDULES))
+    
+    # Статистика вже збережена, файла знімка ще немає
+    path = str(tmp_path / 'snapshot.bin')
+    monkeypatch.setattr(tb, 'SNAPSHOT_PATH', path)
+    make_bot(storage, dict(SCHEDULES))
+    
+    reader = tb.SnapshotReader(path)
+    assert reader.refresh()
+    assert reader.get_periods('2026-02-14') == [(0, 390, True), (390, 570, False), (570, 1440, True)]
+    assert reader.get_stats('2026-02-14') == {'hours_with_power': 21.0, 'hours_without_power': 3.0}
+
+
+def test_one_generation_per_source_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / 'snapshot.bin')
+    monkeypatch.setattr(tb, 'SNAPSHOT_PATH', path)
+    bot = make_bot(tb.MemoryStorage(), dict(SCHEDULES))
+    reader = tb.SnapshotReader(path)
+    reader.refresh()
+    start = reader.generation
+    
+    bot.apply_source_results({'mk': {'3.1': {
+        '2026-02-14': [(0, 0, False), (12, 0, True)],
+        '2026-02-15': [(0, 0, True), (18, 0, False)],
+        '2026-02-16': [(0, 0, True)],
+    }}})
+    
+    assert reader.refresh()
+    assert reader.generation == start + 1
+    assert reader.get_periods('2026-02-16') == [(0, 1440, True)]
+    assert not reader.refresh()
+
+
+def test_publishers_sharing_a_path_never_reuse_a_generation(tmp_path):
+    path = str(tmp_path / 'snapshot.bin')
+    first = tb.SnapshotPublisher(path)
+    second = tb.SnapshotPublisher(path)
+    reader = tb.SnapshotReader(path)
+    
+    index = tb.ScheduleIndex()
+    index.rebuild({'2026-02-14': [(0, 0, True)]})
+    assert first.publish(index, {}) == 1
+    reader.refresh()
+    
+    index.rebuild({'2026-02-14': [(0, 0, False)]})
+    assert second.publish(index, {}) == 2
+    
+    assert reader.refresh()
+    assert reader.get_periods('2026-02-14') == [(0, 1440, False)]
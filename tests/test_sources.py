@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import telegram_bot as tb
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Віддає записані сторінки; /slow/... - із затримкою, /broken - 500"""
+    
+    def do_GET(self):
+        if self.path.startswith('/slow/'):
+            time.sleep(1)
+            self.path = self.path[len('/slow'):]
+        if self.path == '/broken':
+            self.send_error(500)
+            return
+        super().do_GET()
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def fixture_server():
+    handler = functools.partial(FixtureHandler, directory=FIXTURES)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_half_hour_table_adapter(fixture_server):
+    adapter = tb.HalfHourTableAdapter('mk', f"{fixture_server}/table_source.html")
+    result = asyncio.run(adapter.poll())
+    
+    assert result['3.1']['2026-02-14'] == [(0, 0, True), (6, 30, False), (9, 30, True)]
+    assert result['3.1']['2026-02-15'] == [(0, 0, True)]
+    # Погодинний рядок розгортається в півгодинні слоти
+    assert result['3.2']['2026-02-14'] == [(0, 0, True), (12, 0, False), (15, 0, True)]
+    assert result['3.2']['2026-02-15'] == [(0, 0, True), (18, 0, False), (21, 0, True)]
+
+
+def test_json_feed_adapter(fixture_server):
+    adapter = tb.JsonFeedAdapter('kv', f"{fixture_server}/json_feed.json")
+    result = asyncio.run(adapter.poll())
+    
+    assert result['3.1']['2026-02-14'] == [(0, 0, True), (6, 30, False), (9, 30, True)]
+    assert result['4.2']['2026-02-14'] == [(0, 0, False), (4, 0, True)]
+
+
+def test_json_feed_adapter_reads_bot_api(fixture_server):
+    adapter = tb.JsonFeedAdapter('od', f"{fixture_server}/api_range.json")
+    result = asyncio.run(adapter.poll())
+    
+    assert result == {'3.1': {'2026-02-14': [(0, 0, True), (6, 30, False), (9, 30, True)]}}
+
+
+def test_poller_isolates_failures_and_timeouts(fixture_server):
+    adapters = [
+        tb.JsonFeedAdapter('kv', f"{fixture_server}/json_feed.json"),
+        tb.JsonFeedAdapter('slow', f"{fixture_server}/slow/json_feed.json", timeout=0.2),
+        tb.HalfHourTableAdapter('broken', f"{fixture_server}/broken"),
+    ]
+    poller = tb.SourcePoller(adapters)
+    
+    started = time.monotonic()
+    results = asyncio.run(poller.poll_all())
+    
+    assert time.monotonic() - started < 1
+    assert list(results) == ['kv']
+    
+    metrics = poller.snapshot()
+    assert metrics['kv:JsonFeedAdapter']['successes'] == 1
+    assert metrics['slow:JsonFeedAdapter']['failures'] == 1
+    assert metrics['slow:JsonFeedAdapter']['last_error'].startswith('TimeoutError')
+    assert metrics['broken:HalfHourTableAdapter']['last_error'].startswith('HTTPError')
+
+
+def test_poller_keeps_last_good_result(fixture_server):
+    adapter = tb.JsonFeedAdapter('kv', f"{fixture_server}/json_feed.json")
+    poller = tb.SourcePoller([adapter])
+    asyncio.run(poller.poll_all())
+    
+    adapter.url = f"{fixture_server}/broken"
+    results = asyncio.run(poller.poll_all())
+    
+    assert results['kv']['3.1']['2026-02-15'] == [(0, 0, True)]
+    assert poller.snapshot()['kv:JsonFeedAdapter']['failures'] == 1
+
+
+def test_source_batch_syncs_stats_once(bot, monkeypatch):
+    calls = []
+    sync = bot.auto_sync_stats
+    monkeypatch.setattr(bot, 'auto_sync_stats', lambda **kw: calls.append(kw) or sync(**kw))
+    
+    changed = bot.apply_source_results({'mk': {'3.1': {
+        '2026-02-14': [(0, 0, False), (12, 0, True)],
+        '2026-02-15': [(0, 0, True), (18, 0, False)],
+    }}})
+    
+    assert changed == ['2026-02-14', '2026-02-15']
+    assert calls == [{'changed': changed, 'removed': []}]
+    assert bot.load_stats()['2026-02-15']['hours_without_power'] == 6.0
+
+
+class SlowAdapter(tb.SourceAdapter):
+    """fetch спить довше за таймаут; рахує, скільки потоків живі одночасно"""
+    
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    
+    def fetch(self):
+        with SlowAdapter.lock:
+            SlowAdapter.active += 1
+            SlowAdapter.peak = max(SlowAdapter.peak, SlowAdapter.active)
+        time.sleep(0.15)
+        with SlowAdapter.lock:
+            SlowAdapter.active -= 1
+        return '{}'
+    
+    def parse(self, text):
+        return {'thread': threading.current_thread() is not threading.main_thread()}
+
+
+def test_concurrency_limit_counts_threads_past_timeout():
+    adapters = [SlowAdapter(f'r{i}', 'unused', timeout=0.05) for i in range(3)]
+    poller = tb.SourcePoller(adapters, concurrency=1)
+    
+    async def run():
+        await poller.poll_all()
+        # Перше опитування впало по таймауту, але потік ще живий - другий цикл чекає на слот
+        await poller.poll_all()
+        await asyncio.sleep(0.3)
+    
+    asyncio.run(run())
+    
+    assert SlowAdapter.peak == 1
+
+
+def test_parse_runs_off_the_event_loop():
+    adapter = SlowAdapter('r', 'unused', timeout=1)
+    assert asyncio.run(adapter.poll()) == {'thread': True}
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import telegram_bot as tb
+
+
+def make_update(update_id, chat_id):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_busy_chat_does_not_take_all_slots():
+    async def run():
+        processor = tb.ChatOrderedUpdateProcessor(4)
+        started = time.monotonic()
+        finished = {}
+        
+        async def handler(update_id, duration):
+            await asyncio.sleep(duration)
+            finished[update_id] = time.monotonic() - started
+        
+        tasks = [
+            asyncio.create_task(processor.process_update(make_update(i, 1), handler(i, 0.1)))
+            for i in range(6)
+        ]
+        await asyncio.sleep(0)
+        await processor.process_update(make_update(100, 2), handler(100, 0))
+        await asyncio.gather(*tasks)
+        return finished
+    
+    finished = asyncio.run(run())
+    
+    assert finished[100] < 0.05
+    assert [i for i in sorted(finished, key=finished.get) if i != 100] == list(range(6))
+
+
+def test_global_limit_still_applies():
+    async def run():
+        processor = tb.ChatOrderedUpdateProcessor(2)
+        state = {'active': 0, 'peak': 0}
+        
+        async def handler():
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+            await asyncio.sleep(0.01)
+            state['active'] -= 1
+        
+        await asyncio.gather(*(
+            processor.process_update(make_update(i, i), handler()) for i in range(6)
+        ))
+        return state['peak']
+    
+    assert asyncio.run(run()) == 2
+
+
+def test_ptb_still_gates_process_update_with_semaphore():
+    """Обхід @final process_update спирається на приватний _semaphore PTB 20.7"""
+    import inspect
+    from telegram.ext import BaseUpdateProcessor
+    
+    assert '_semaphore' in BaseUpdateProcessor.__slots__
+    assert 'self._semaphore' in inspect.getsource(BaseUpdateProcessor.process_update)
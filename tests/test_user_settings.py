@@ -0,0 +1,41 @@
+import asyncio
+
+import telegram_bot as tb
+
+
+class CountingStorage(tb.MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+    
+    def load_record(self, name, key):
+        self.reads.append(key)
+        return super().load_record(name, key)
+
+
+def test_lru_stays_bounded_and_flushes_evicted_changes():
+    storage = CountingStorage()
+    users = tb.UserSettingsStore(storage, capacity=3)
+    
+    for user_id in range(10):
+        users.update(user_id, reminder_minutes=user_id)
+    
+    assert users.snapshot()['cached'] == 3
+    assert users.flush() == 10
+    assert storage.load_record(tb.USER_SETTINGS, '4') == {'reminder_minutes': 4}
+
+
+def test_get_async_reads_storage_only_on_miss():
+    storage = CountingStorage()
+    storage.save_records(tb.USER_SETTINGS, {'7': {'group': '4.2'}})
+    users = tb.UserSettingsStore(storage, capacity=3)
+    
+    async def run():
+        first = await users.get_async(7)
+        second = await users.get_async(7)
+        return first, second
+    
+    first, second = asyncio.run(run())
+    
+    assert first == second == {'group': '4.2', 'reminder_minutes': 0}
+    assert storage.reads == ['7']
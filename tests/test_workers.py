@@ -0,0 +1,148 @@
+import asyncio
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import telegram_bot as tb
+
+
+class RecordingStorage(tb.MemoryStorage):
+    """Спільне сховище, що запам'ятовує, з яких потоків його викликали"""
+    
+    shared = True
+    
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+    
+    def load(self, name, default):
+        self.calls.append((name, threading.current_thread()))
+        return super().load(name, default)
+    
+    def save(self, name, data):
+        self.calls.append((name, threading.current_thread()))
+        super().save(name, data)
+
+
+def make_update(chat_id, chat_type='private', text=None):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=chat_id),
+        effective_chat=SimpleNamespace(id=chat_id, type=chat_type),
+        message=SimpleNamespace(text=text)
+    )
+
+
+def test_handlers_keep_storage_off_the_loop(bot):
+    storage = RecordingStorage()
+    bot.storage = storage
+    
+    async def reply(*args, **kwargs):
+        pass
+    
+    bot.reply_text = reply
+    bot.reply_photo = reply
+    bot.generate_stats_image = lambda stats=None: None
+    
+    async def run():
+        loop_thread = threading.current_thread()
+        await bot.handle_message(make_update(1, text="⏱️ Таймер світла"), None)
+        await bot.timer_command(make_update(1), None)
+        await bot.send_stats(make_update(1))
+        await bot.start_command(make_update(-100, chat_type='group'), None)
+        return loop_thread
+    
+    loop_thread = asyncio.run(run())
+    
+    assert storage.calls
+    assert all(thread is not loop_thread for _, thread in storage.calls)
+
+
+def test_group_id_is_cached_in_shared_storage(bot, monkeypatch):
+    storage = RecordingStorage()
+    bot.storage = storage
+    storage.save(bot.group_chat_file, {'group_chat_id': -100})
+    storage.calls.clear()
+    
+    async def run():
+        for _ in range(20):
+            await bot.handle_message(make_update(-100, chat_type='group'), None)
+    
+    asyncio.run(run())
+    assert len(storage.calls) == 1
+    
+    # Після TTL перечитуємо - інший воркер міг змінити групу
+    monkeypatch.setattr(tb, 'GROUP_CHAT_ID_TTL', 0)
+    storage.save(bot.group_chat_file, {'group_chat_id': -200})
+    assert bot.load_group_chat_id() == -200
+
+
+def make_worker(storage, index, monkeypatch):
+    monkeypatch.setattr(tb, 'WORKER_COUNT', 2)
+    clock = tb.SimulatedClock(datetime(2026, 2, 14, 7, 0, tzinfo=tb.KYIV_TZ))
+    worker = tb.PowerScheduleBot(None, clock=clock, schedules={}, storage=storage)
+    worker.worker_index = index
+    worker.worker_id = f'worker-{index}'
+    return worker
+
+
+def make_chat_update(update_id, chat_id):
+    return tb.Update.de_json({
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': 'x'}
+    }, None)
+
+
+def test_live_worker_takes_over_and_hands_back_a_shard(tmp_path, monkeypatch):
+    storage = tb.SqliteStorage(str(tmp_path / 'state.sqlite3'))
+    first = make_worker(storage, 0, monkeypatch)
+    second = make_worker(storage, 1, monkeypatch)
+    
+    # Перший стартував раніше і тримає обидва шарди, доки другий не подасть пульс
+    first.refresh_shards()
+    assert first.owned_shards == {0, 1}
+    second.refresh_shards()
+    first.refresh_shards()
+    second.refresh_shards()
+    assert (first.owned_shards, second.owned_shards) == ({0}, {1})
+    
+    # Другий воркер завис: його оренди прострочені
+    storage._conn.execute("UPDATE leases SET expires_at = 0 WHERE holder = 'worker-1'")
+    first.refresh_shards()
+    assert first.owned_shards == {0, 1}
+    
+    # Повернувся - шард поки в першого, той віддає його на наступному колі
+    second.refresh_shards()
+    assert second.owned_shards == set()
+    first.refresh_shards()
+    second.refresh_shards()
+    assert (first.owned_shards, second.owned_shards) == ({0}, {1})
+
+
+def test_chat_updates_keep_order_through_the_inbox(tmp_path, monkeypatch):
+    storage = tb.SqliteStorage(str(tmp_path / 'state.sqlite3'))
+    worker = make_worker(storage, 0, monkeypatch)
+    worker.owned_shards = {0, 1}
+    
+    class Application:
+        bot = None
+        update_queue = asyncio.Queue()
+    
+    async def run():
+        # Свій шард (чат 2) теж іде через inbox, разом із підхопленим (чат 1)
+        for update_id, chat_id in [(3, 2), (1, 2), (2, 2), (5, 1), (4, 1)]:
+            try:
+                await worker.route_update(make_chat_update(update_id, chat_id), None)
+            except tb.ApplicationHandlerStop:
+                continue
+            raise AssertionError("апдейт чату оброблено повз inbox")
+        
+        task = asyncio.create_task(worker.inbox_loop(Application))
+        fed = [await asyncio.wait_for(Application.update_queue.get(), 1) for _ in range(5)]
+        task.cancel()
+        
+        # Повторно згодовані апдейти проходять route_update без змін
+        for update in fed:
+            assert await worker.route_update(update, None) is None
+        return [(update.effective_chat.id, update.update_id) for update in fed]
+    
+    assert asyncio.run(run()) == [(2, 1), (2, 2), (2, 3), (1, 4), (1, 5)]